@@ -2,11 +2,18 @@ from flask import Flask, render_template, request
 from flask_socketio import SocketIO
 import threading
 import time
-import random
-from assembly_to_schematic import generator
-import copy
+from assembly_to_schematic import generator, assembler
 import re
+import random
 import webview
+import timing_model
+import wire_format
+import json
+import io_devices
+import program_library
+import runtime_metrics
+import machine_code_simulator
+from timing_model import TimingModel
 
 app = Flask(__name__)
 socketio = SocketIO(app)
@@ -17,43 +24,71 @@ PORT: int = 5001
 EXPERIMENTAL_GUI: bool = False
 ZOOM_LEVEL_GUI: str = '67%'
 
+TIMING_MODEL: TimingModel = TimingModel()  # Redstone ticks per instruction on the Minecraft CPU, see timing_model.py
+
+OPTIMIZE_ASSEMBLY: bool = False  # Run the peephole optimizer on the program before simulating / generating the schematic
+
+VERIFY_MACHINE_CODE: bool = True  # Run the machine code next to the assembly before generating the schematic, see machine_code_simulator.py
+VERIFY_CYCLES: int = 20000  # Compared cycles (programs that don't halt are only compared this far, ~0.2 s)
+
+SKIP_IDLE_LOOPS: bool = True  # Suspend busy-wait loops (e.g. polling the controller) until an input arrives, see fast_forward_idle_loop
+IDLE_TIMEOUT: float = 0.25  # Seconds an idle loop stays suspended without an input (to update the in-game time)
+
+PANELS: list[str] = ['registers', 'ps', 'pd', 'data_memory', 'alu_flags', 'call_stack', 'preprocessed_assembly']
+MEMORY_PAGE_SIZE: int = 16
+MEMORY_PAGES: int = 256 // MEMORY_PAGE_SIZE
+
+metrics: runtime_metrics.RuntimeMetrics = runtime_metrics.RuntimeMetrics()  # Served at /metrics, see runtime_metrics.py
+
+library: program_library.ProgramLibrary = program_library.ProgramLibrary()  # programs/ & example_programs/, with a cache of compiled programs
+
+subscriptions: dict[str, dict] = {}  # Socket.IO session id -> panels / memory pages the client is showing
+program_version: int = 0  # Incremented every time the program changes, the listing is only sent once per version
+
 
 class Simulator:
-    def __init__(self, speed: int):
+    def __init__(self, speed: int, rng: random.Random | None = None):  # rng: For the random number device
         self.REGISTERS: dict[str, str] = {f'R{i}': 16 * '0' for i in range(32)}
         self.DATA_MEMORY_ADDRESSES: dict[str, str] = {f'D{i}': 16 * '0' for i in range(256)}
-        self.PORTS_WRITE_ONLY: dict[str, str] = {f'P{i}': 16 * '0' for i in range(8)}
-        self.PORTS_READ_ONLY: dict[str, str] = {f'P{i}': 16 * '0' for i in range(8)}
-        self.PORTS_READ_ONLY['P1']: dict[str, str] = format(random.randint(0, 65535), '016b')  # Start with random 16-bit Number
         self.ALU_FLAGS: dict[str, bool] = {'BEQ': False, 'BNE': False, 'BLT': False, 'BGT': False}
         self.call_stack: list[str] = []
         self.simulation_running: bool = False
+        self.program: program_library.CompiledProgram | None = None
         self.program_counter: str = 16 * '0'  # To not re-write int_to_bin & bin_to_int, we consider this a 16-bit Number. Doesn't change anything.
 
-        self.screen_data: list[list[int]] = [[0 for _ in range(31)] for _ in range(31)]
-        self.screen_buffer: list[list[int]] = [[0 for _ in range(31)] for _ in range(31)]
-        self.screen_d_latch_data: int = 0
-        self.screen_x: int = 0
-        self.screen_y: int = 0
-        self.letters_data: list[str] = ['_' for _ in range(11)]
-        self.letters_buffer: list[str] = ['_' for _ in range(11)]
-        self.letters_pointer: int = 0
-        self.number: str = '___'
-        self.big_number: str = '_____'
+        # I/O Devices, see io_devices.DEVICES
+        self.io_bus, self.devices = io_devices.create_bus({'random_number': io_devices.RandomNumber(rng)})
+        self.controller: io_devices.Controller = self.devices['controller']  # The devices shown in the UI
+        self.random_number: io_devices.RandomNumber = self.devices['random_number']
+        self.letters: io_devices.LetterDisplay = self.devices['letters']
+        self.number_display: io_devices.NumberDisplay = self.devices['number_display']
+        self.screen: io_devices.Screen = self.devices['screen']
+
+        self.screen_data: list[list[int]] = self.screen.screen_data()  # Refreshed (with packed_screen) when the screen is dirty
+        self.packed_screen: bytes = wire_format.pack_screen(self.screen.rows)
 
         self.OPERATIONS: list[str] = ['NOP', 'ADD', 'SUB', 'XOR', 'OR', 'AND', 'RSH', 'ADI', 'ST', 'LD', 'PT-ST', 'PT-LD', 'JMP', 'CAL',
                            'RET', 'BEQ', 'BNE', 'BLT', 'BGT', 'HLT']
 
         self.speed: int = speed
-        self.controller: dict[str, int] = {'UP': 0, 'RIGHT': 0, 'DOWN': 0, 'LEFT': 0, 'START': 0, 'SELECT': 0, 'Y': 0, 'X': 0}
-
-    def read_assembly_file(self) -> list[str]:
+        self.hardware_speed: bool = False  # Run at the speed of the Minecraft CPU (TIMING_MODEL) instead of self.speed
+        self.redstone_ticks: int = 0  # Projected time on the Minecraft CPU
+        self.last_instruction_ticks: int = 0
+        self.tick_profile: dict[int, int] = {}  # Redstone ticks spent per instruction address
+
+        # Idle loop detection: The state at the target of the last backward jump, and the instructions executed since then
+        self.loop_head: tuple | None = None
+        self.loop_head_memory: tuple | None = None  # Data memory & I/O devices, see is_idle_loop
+        self.iteration_trace: list[tuple[int, int]] = []  # (Address, redstone ticks)
+        self.wake_event: threading.Event = threading.Event()  # Set on inputs, stop and speed changes
+
+    def read_assembly_file(self) -> str:
         try:
             with open(SAVE_PATH, 'r') as file:
-                return [line.strip() for line in file if line.strip()]
+                return file.read()
         except FileNotFoundError:
             self.display_error_message(f'Fatal Error. File "{SAVE_PATH}"was not found. Perhaps create it?')
-            return []
+            return ''
 
 
     def remove_comments(self, lines: list[str]) -> list[str]:
@@ -142,8 +177,18 @@ class Simulator:
             result.append(" ".join(new_tokens))
         return result
 
+    def load_program(self) -> program_library.CompiledProgram:
+        # Loaded once per simulator (a new simulator gets created whenever the program changes)
+        if self.program is None:
+            self.program = library.compile(self.read_assembly_file(), self.preprocess_source,
+                                           variant='optimized' if OPTIMIZE_ASSEMBLY else '')
+        return self.program
+
     def preprocess_assembly(self) -> list[str]:
-        lines: list[str] = self.read_assembly_file()
+        return self.load_program().lines
+
+    def preprocess_source(self, source: str) -> list[str]:
+        lines: list[str] = [line.strip() for line in source.splitlines() if line.strip()]
 
         if not lines:
             return []
@@ -158,19 +203,14 @@ class Simulator:
 
         lines = self.extract_characters(lines)
 
-        return lines
-
-    def bin_to_char(self, bin_str: str) -> str:
-        bin_to_char: dict[str, str] = {
-            '00001': 'A', '00010': 'B', '00011': 'C', '00100': 'D', '00101': 'E',
-            '00110': 'F', '00111': 'G', '01000': 'H', '01001': 'I', '01010': 'J',
-            '01011': 'K', '01100': 'L', '01101': 'M', '01110': 'N', '01111': 'O',
-            '10000': 'P', '10001': 'Q', '10010': 'R', '10011': 'S', '10100': 'T',
-            '10101': 'U', '10110': 'V', '10111': 'W', '11000': 'X', '11001': 'Y',
-            '11010': 'Z', '00000': ' '
-        }
+        if OPTIMIZE_ASSEMBLY and lines:
+            try:
+                lines, _ = assembler.optimize_assembly(lines)
+            except (ValueError, IndexError) as error:
+                self.display_error_message(f'Fatal Error. Could not optimize the program ({error})')
+                return []
 
-        return bin_to_char[bin_str]
+        return lines
 
     def char_to_num(self, char: str) -> str:
         if char == ' ':
@@ -203,11 +243,11 @@ class Simulator:
         if self.ALU_FLAGS['BEQ'] is False and self.ALU_FLAGS['BLT'] is False:
             self.ALU_FLAGS['BGT'] = True
 
-    def execute_instruction(self, instruction: str) -> None:
-        parts: list[str] = instruction.split()
+    def execute_instruction(self, parts: list[str]) -> None:  # Decoded instruction, see CompiledProgram.instructions
         operation: str = parts[0]
         mask: int = 0xFFFF  # Ensure 16 Bit Result
         jump_instruction: bool = False
+        address: int = self.bin_to_int(self.program_counter)
 
         if operation not in self.OPERATIONS:
             self.display_error_message(f'Fatal Error. Operation {operation} not in Operations {self.OPERATIONS}')
@@ -250,14 +290,17 @@ class Simulator:
                 (self.bin_to_int(self.REGISTERS[parts[2]]) + int(parts[3])) & mask
             )
             self.update_alu_flags(self.REGISTERS[parts[1]])
-        elif operation == 'ST':
-            self.DATA_MEMORY_ADDRESSES['D' + str(
-                self.bin_to_int(self.REGISTERS[parts[2]]) + int(parts[3])
-            )] = self.REGISTERS[parts[1]]
-        elif operation == 'LD':
-            self.REGISTERS[parts[1]] = self.DATA_MEMORY_ADDRESSES['D' + str(
-                self.bin_to_int(self.REGISTERS[parts[2]]) + int(parts[3])
-            )]
+        elif operation in ('ST', 'LD'):
+            data_address = self.bin_to_int(self.REGISTERS[parts[2]]) + int(parts[3])
+            if f'D{data_address}' not in self.DATA_MEMORY_ADDRESSES:  # No wrap around (D256 / D-1 don't exist)
+                self.simulation_running = False
+                self.display_error_message(f'Data memory address {data_address} out of range')
+                return
+
+            if operation == 'ST':
+                self.DATA_MEMORY_ADDRESSES[f'D{data_address}'] = self.REGISTERS[parts[1]]
+            else:
+                self.REGISTERS[parts[1]] = self.DATA_MEMORY_ADDRESSES[f'D{data_address}']
         elif operation == 'PT-ST':
             self.port_store(parts[2][1:], self.REGISTERS[parts[1]])
         elif operation == 'PT-LD':
@@ -294,8 +337,6 @@ class Simulator:
             self.simulation_running = False
             jump_instruction = True  # In case Program gets continued again, Halt will be spammed
 
-        self.PORTS_READ_ONLY['P1'] = format(random.randint(0, 65535), '016b')  # Generate Random Number at Port 1 for each clock cycle
-
         if self.REGISTERS['R0'] != 16 * '0':
             self.REGISTERS['R0'] = 16 * '0'  # Make sure r0 is always 0
 
@@ -310,206 +351,312 @@ class Simulator:
                 self.bin_to_int(self.program_counter) + 1
             )
 
+        self.last_instruction_ticks = TIMING_MODEL.instruction_ticks(parts, jump_instruction)
+        self.redstone_ticks += self.last_instruction_ticks
+        self.tick_profile[address] = self.tick_profile.get(address, 0) + self.last_instruction_ticks
+
     def port_load(self, address: str, bin_reg_address: str) -> None:
-        bin_address: str = self.int_to_bin(int(address))[13:16]
-
-        value: str = 16 * '0'
-
-        if bin_address == '000':
-            value: str = (8 * '0' + str(self.controller['X']) + str(self.controller['Y']) +
-                     str(self.controller['SELECT']) + str(self.controller['START']) +
-                     str(self.controller['LEFT']) + str(self.controller['DOWN']) +
-                     str(self.controller['RIGHT']) + str(self.controller['UP']))
-
-            self.controller = {'UP': self.controller['UP'],
-                               'RIGHT': self.controller['RIGHT'],
-                               'DOWN': self.controller['DOWN'],
-                               'LEFT': self.controller['LEFT'],
-                               'START': 0, 'SELECT': 0, 'Y': 0, 'X': 0}
-
-            # bug fix! update the controller buttons AFTER loading it to a register.
-            new_controller_value = (8 * '0' + str(self.controller['X']) + str(self.controller['Y']) +
-                     str(self.controller['SELECT']) + str(self.controller['START']) +
-                     str(self.controller['LEFT']) + str(self.controller['DOWN']) +
-                     str(self.controller['RIGHT']) + str(self.controller['UP']))
-
-            self.PORTS_READ_ONLY[f'P{address}'] = new_controller_value
-            # Bit 1 (LSB): D-Pad Up
-            # Bit 2: D-Pad Right
-            # Bit 3: D-Pad Down
-            # Bit 4: D-Pad Left
-            # Bit 5: Start
-            # Bit 6: Select
-            # Bit 7: Y
-            # Bit 8 (MSB): X
-        elif bin_address == '001':
-            value = self.PORTS_READ_ONLY[f'P{address}']
-
-        self.REGISTERS[bin_reg_address] = value
+        self.REGISTERS[bin_reg_address] = self.int_to_bin(self.io_bus.load(int(address)))
 
     def port_store(self, address: str, bin_value: str) -> None:
-        bin_address = self.int_to_bin(int(address))[13:16]
-
-        # print(f'Port Store, {address = }, {bin_value = }')
-
-        self.PORTS_WRITE_ONLY[f'P{address}'] = bin_value
-
-        if bin_address == '000':  # Format: XXXXXXXXXXXXXX (14), Clear Letter Buffer (1), Update Letter Buffer (1)
-            if bin_value[15] == '1':  # Update Letter Buffer
-                self.letters_data = self.letters_buffer
-            if bin_value[14] == '1':  # Clear Letter Buffer
-                self.letters_pointer = 0
-                self.letters_buffer = self.letters_buffer = ['_' for _ in range(11)]
-        elif bin_address == '001':  # Format: XXXXXXXXXXX (11), Character (5)
-            char = self.bin_to_char(bin_value[11:16])
-            self.letters_buffer[self.letters_pointer] = char
-            self.letters_pointer += 1
-            if self.letters_pointer > 10:
-                self.letters_pointer = 0
-        elif bin_address == '010':  # Format: XXXXXX (6), Sign Mode (1), Enable (1), Number (8)
-            self.number = str(format(self.bin_to_int(bin_value[8:16]), '03d'))
-            self.big_number = str(format(self.bin_to_int(bin_value), '05d'))  # <- 16 Bit Testing Display
-
-            if bin_value[6] == '1':  # Sign Mode
-                self.number = str(format(int(self.number), '03d') if int(self.number) < 128 else format(int(self.number) - 256, '04d'))
-            if bin_value[7] == '0':  # Disable
-                self.number = '___'
-        elif bin_address == '011':  # Format: XXXXXX (6), X (5), Y (5)
-            self.screen_x = self.bin_to_int(bin_value[6:11])
-            self.screen_y = self.bin_to_int(bin_value[11:16])
-            # print(self.screen_x, self.screen_y)
-        elif bin_address == '100':  # Draws the Pixel on store with any value
-            try:
-                self.screen_buffer[31 - self.screen_y][31 - self.screen_x] = self.screen_d_latch_data
-            except IndexError:
-                self.display_error_message(f'Screen Coordinates: [X: {self.screen_x}, Y: {self.screen_y}] not found. X, Y must be in range [1;31]')
-                return
-        elif bin_address == '101':  # Format: XXXXXXXXXXXXXXX (15), Screen Data Value (1)
-            self.screen_d_latch_data = int(bin_value[15])
-        elif bin_address == '110':  # Sets all Pixels on store with any value
-            for x in range(31):
-                for y in range(31):
-                    self.screen_buffer[y][x] = self.screen_d_latch_data
-        elif bin_address == '111':  # Pushes the Buffer on store with any value
-            self.screen_data = copy.deepcopy(self.screen_buffer)
+        try:
+            self.io_bus.store(int(address), self.bin_to_int(bin_value))
+        except ValueError as error:
+            self.display_error_message(str(error))
 
     def reset_simulation(self) -> None:
         global simulator
 
         self.simulation_running = False
+        self.wake_event.set()
 
         simulator = Simulator(simulator.speed)
+        simulator.hardware_speed = self.hardware_speed
 
         _ = simulator.return_info(emit=True)
 
     def step_simulation(self) -> None:
         self.simulation_running = False
 
-        processed_lines = self.preprocess_assembly()
+        instructions = self.load_program().instructions
 
         try:
-            current_instruction = processed_lines[self.bin_to_int(self.program_counter)]
+            current_instruction = instructions[self.bin_to_int(self.program_counter)]
         except IndexError:
             self.display_error_message('No halt at the end of the program')
             return
 
-        self.execute_instruction(current_instruction.upper())
+        self.execute_instruction(current_instruction)
 
         _ = self.return_info(emit=True)
 
     def break_simulation(self) -> None:
         self.simulation_running = False
+        self.wake_event.set()
 
         _ = self.return_info(emit=True)
 
     def run_simulation(self) -> None:
         self.simulation_running = True
 
-        processed_lines = self.preprocess_assembly()
+        instructions = self.load_program().instructions
 
         next_time = time.perf_counter()
 
-        while self.simulation_running:
-            if not self.simulation_running:
-                break  # Exits, if no longer running
+        metrics.simulation_threads += 1
+        metrics.restart_window(next_time)
+        self.loop_head = None  # Steps in between aren't part of the iteration trace
+        self.iteration_trace = []
 
-            interval = 1 / max(1, self.speed)  # Interval between executes, re-calculate every time, also avoids ZeroDivisionError
+        try:
+            while self.simulation_running:
+                if not self.simulation_running:
+                    break  # Exits, if no longer running
 
-            now = time.perf_counter()
+                now = time.perf_counter()
 
-            if now < next_time:
-                sleep_duration = next_time - now
-                time.sleep(sleep_duration)
-            else:
-                next_time = now  # catch up if we lag
+                if now < next_time:
+                    sleep_duration = next_time - now
+                    time.sleep(sleep_duration)
+                    started = time.perf_counter()
+                    metrics.sleep_seconds += started - now
+                else:
+                    if now - next_time > runtime_metrics.LAG_THRESHOLD:
+                        metrics.lag_events += 1
+                        metrics.lag_seconds += now - next_time
+                    next_time = now  # catch up if we lag
+                    started = now
 
-            if not self.simulation_running:
-                break  # Exits, if no longer running
+                if not self.simulation_running:
+                    break  # Exits, if no longer running
 
-            try:
-                current_instruction = processed_lines[self.bin_to_int(self.program_counter)]
-            except IndexError:
-                self.display_error_message('No halt at the end of the program')
-                return
+                address = self.bin_to_int(self.program_counter)
+
+                try:
+                    current_instruction = instructions[address]
+                except IndexError:
+                    self.display_error_message('No halt at the end of the program')
+                    return
 
-            self.execute_instruction(current_instruction.upper())
-
-            _ = self.return_info(emit=True)
-
-            next_time += interval
-
-    def return_info(self, emit: bool) -> list[dict[str, str] | list[list[int]] | str | int | bool | list[str]]:
-        decimal_info_list = [
-            {f'{key[0]}{format(int(key[1:]), "02d")}': f'{format(self.bin_to_int(value), "05d")}' for key, value in
-             self.REGISTERS.items()},
-            {f'{key[0]}{format(int(key[1:]), "01d")}': f'{format(self.bin_to_int(value), "05d")}' for key, value in
-             self.PORTS_READ_ONLY.items()},
-            {f'{key[0]}{format(int(key[1:]), "01d")}': f'{format(self.bin_to_int(value), "05d")}' for key, value in
-             self.PORTS_WRITE_ONLY.items()},
-            {f'{key[0]}{format(int(key[1:]), "03d")}': f'{format(self.bin_to_int(value), "05d")}' for key, value in
-             self.DATA_MEMORY_ADDRESSES.items()},
-            {key: str(value) for key, value in self.ALU_FLAGS.items()},  # Return it in a string-form
-            f'{format(self.bin_to_int(self.program_counter), "04d")}',
-            {f'{format(key, "02d")}': format(self.bin_to_int(self.call_stack[key]), '04d') if key < len(self.call_stack) else '0000' for key in range(16)},  # replace with call_stack dict
-            self.screen_data,
-            ''.join(self.letters_data),
-            self.number,
-            self.simulation_running,
-            self.bin_to_int(self.program_counter),
-            self.preprocess_assembly(),
-            self.big_number
-        ]
+                self.execute_instruction(current_instruction)
+                executed = time.perf_counter()
+
+                idle = False
+                if SKIP_IDLE_LOOPS:  # The trace is cleared at every backward jump (is_idle_loop)
+                    self.iteration_trace.append((address, self.last_instruction_ticks))
+                    next_address = self.bin_to_int(self.program_counter)
+                    idle = next_address <= address and self.simulation_running and self.is_idle_loop(next_address)
+
+                _ = self.return_info(emit=True)
+                emitted = time.perf_counter()
+
+                if self.hardware_speed:
+                    interval = TIMING_MODEL.seconds(self.last_instruction_ticks)  # As long as the executed instruction takes in Minecraft
+                else:
+                    interval = 1 / max(1, self.speed)  # Interval between executes, re-calculate every time, also avoids ZeroDivisionError
+
+                next_time += interval
+
+                metrics.instructions += 1
+                metrics.scheduled_seconds += interval
+                metrics.execute_seconds += executed - started
+                metrics.emit_seconds += emitted - executed
+                if emitted - metrics.window_start >= runtime_metrics.STATS_INTERVAL:
+                    metrics.update_rates(emitted)
+                    emit_stats()
+
+                if idle:
+                    next_time = self.fast_forward_idle_loop(next_time)
+        finally:
+            metrics.simulation_threads -= 1
+            metrics.restart_window(time.perf_counter())
+            emit_stats()
+
+    def is_idle_loop(self, head: int) -> bool:
+        # Called after every backward jump: If the whole state at the jump target is the same as after the last jump to it,
+        # without port stores or random numbers in between, every further iteration is the same until an input changes
+        self.wake_event.clear()  # Before taking the state, so inputs after it wake up the suspended loop
+
+        loop_head = (head, tuple(self.REGISTERS.values()), tuple(self.ALU_FLAGS.values()), tuple(self.call_stack),
+                     self.io_bus.stores, self.random_number.reads)
+
+        if loop_head != self.loop_head:
+            # Memory & devices are only compared once the rest stops changing, that's enough for most loops
+            self.loop_head = loop_head
+            self.loop_head_memory = None
+            self.iteration_trace = []
+            return False
+
+        loop_head_memory = (tuple(self.DATA_MEMORY_ADDRESSES.values()), self.io_bus.state())
+        idle = loop_head_memory == self.loop_head_memory
+        self.loop_head_memory = loop_head_memory
+        if not idle:
+            self.iteration_trace = []
+        return idle
+
+    def fast_forward_idle_loop(self, next_time: float) -> float:
+        # Suspends until an input (or IDLE_TIMEOUT), then accounts for the iterations that would have run in the meantime
+        # Returns the time the next instruction is due
+        iteration = self.iteration_trace
+        self.iteration_trace = []
+        ticks = sum(instruction_ticks for _, instruction_ticks in iteration)
+
+        if self.hardware_speed:
+            iteration_interval = TIMING_MODEL.seconds(ticks)
+        else:
+            iteration_interval = len(iteration) / max(1, self.speed)
+
+        if iteration_interval <= 0:
+            return next_time
+
+        suspended = time.perf_counter()
+        self.wake_event.wait(max(IDLE_TIMEOUT, iteration_interval))
+        now = time.perf_counter()
+
+        iterations = int(max(0.0, now - next_time) / iteration_interval)
+        self.redstone_ticks += iterations * ticks
+        for address, instruction_ticks in iteration:
+            self.tick_profile[address] += iterations * instruction_ticks
+
+        metrics.idle_seconds += now - suspended
+        metrics.instructions += iterations * len(iteration)
+        metrics.skipped_instructions += iterations * len(iteration)
+        metrics.scheduled_seconds += iterations * iteration_interval
+
+        return now
+
+    def return_panel(self, panel: str, memory_pages: tuple[int, int] = (0, MEMORY_PAGES - 1)) -> dict[str, str] | list[str]:
+        if panel == 'registers':
+            return {f'{key[0]}{format(int(key[1:]), "02d")}': f'{format(self.bin_to_int(value), "05d")}' for key, value in
+                    self.REGISTERS.items()}
+        elif panel == 'ps':
+            return {f'P{port}': format(self.io_bus.peek(port), '05d') for port in range(io_devices.PORTS)}
+        elif panel == 'pd':
+            return {f'P{port}': format(value, '05d') for port, value in enumerate(self.io_bus.written)}
+        elif panel == 'data_memory':  # Only the requested pages (inclusive)
+            return {f'D{format(address, "03d")}': f'{format(self.bin_to_int(self.DATA_MEMORY_ADDRESSES[f"D{address}"]), "05d")}'
+                    for address in range(memory_pages[0] * MEMORY_PAGE_SIZE, (memory_pages[1] + 1) * MEMORY_PAGE_SIZE)}
+        elif panel == 'alu_flags':
+            return {key: str(value) for key, value in self.ALU_FLAGS.items()}  # Return it in a string-form
+        elif panel == 'call_stack':
+            return {f'{format(key, "02d")}': format(self.bin_to_int(self.call_stack[key]), '04d') if key < len(self.call_stack) else '0000' for key in range(16)}  # replace with call_stack dict
+        elif panel == 'preprocessed_assembly':
+            return self.preprocess_assembly()
+        return {}
+
+    def return_binary_info(self, info: dict, sections: list[str], memory_pages: tuple[int, int]) -> bytes:
+        # See wire_format.py
+        words: list[int] = [info['int_pc'], int(self.simulation_running)]
+
+        if 'registers' in sections:
+            words += [self.bin_to_int(value) for value in self.REGISTERS.values()]
+        if 'ps' in sections:
+            words += [self.io_bus.peek(port) for port in range(io_devices.PORTS)]
+        if 'pd' in sections:
+            words += self.io_bus.written
+        if 'data_memory' in sections:
+            first_address = memory_pages[0] * MEMORY_PAGE_SIZE
+            count = (memory_pages[1] - memory_pages[0] + 1) * MEMORY_PAGE_SIZE
+            words += [first_address, count] + [self.bin_to_int(self.DATA_MEMORY_ADDRESSES[f'D{address}'])
+                                               for address in range(first_address, first_address + count)]
+        if 'call_stack' in sections:
+            words += [len(self.call_stack)] + [self.bin_to_int(address) for address in self.call_stack]
+        if 'alu_flags' in sections:
+            words.append(sum(1 << bit for bit, flag in enumerate(wire_format.ALU_FLAG_BITS) if self.ALU_FLAGS[flag]))
+
+        return wire_format.encode_update(words, sections, self.packed_screen,
+                                         [info['letters'], info['number'], info['big_number'], info['in_game_time']])
+
+    def return_info(self, emit: bool) -> dict[str, list[list[int]] | str | int | bool]:
+        if self.screen.dirty:  # The screen only changes when the buffer gets pushed
+            self.screen_data = self.screen.screen_data()
+            self.packed_screen = wire_format.pack_screen(self.screen.rows)
+            self.screen.dirty = False
+
+        # Always sent, every other panel is only computed & sent to the clients subscribed to it (see handle_subscribe)
+        info = {
+            'pc': f'{format(self.bin_to_int(self.program_counter), "04d")}',
+            'screen_data': self.screen_data,
+            'letters': self.letters.text(),
+            'number': self.number_display.number,
+            'simulation_running': self.simulation_running,
+            'int_pc': self.bin_to_int(self.program_counter),
+            'big_number': self.number_display.big_number,
+            'in_game_time': timing_model.format_duration(TIMING_MODEL.seconds(self.redstone_ticks))
+        }
 
         if emit:
-            socketio.emit('simulation_update', {
-                'pc': decimal_info_list[5],
-                'registers': decimal_info_list[0],
-                'ps': decimal_info_list[1],
-                'pd': decimal_info_list[2],
-                'data_memory': decimal_info_list[3],
-                'alu_flags': decimal_info_list[4],
-                'call_stack': decimal_info_list[6],
-                'letters': decimal_info_list[8],
-                'number': decimal_info_list[9],
-                'screen_data': decimal_info_list[7],
-                'int_pc': decimal_info_list[11],
-                'preprocessed_assembly': decimal_info_list[12],
-                'big_number': decimal_info_list[13]
-            })
-
-        return decimal_info_list
+            panels: dict[str, dict[str, str] | list[str]] = {}  # Shared between clients with the same subscription
+            packed_updates: dict[tuple, bytes] = {}
+
+            for sid, subscription in list(subscriptions.items()):
+                start = time.perf_counter()
+
+                if subscription.get('binary'):
+                    sections = [panel for panel in wire_format.SECTIONS if panel in subscription['panels']]
+                    key = (tuple(sections), subscription['memory_pages'])
+                    if key not in packed_updates:
+                        packed_updates[key] = self.return_binary_info(info, sections, subscription['memory_pages'])
+                    update = {'binary': packed_updates[key]}
+                else:
+                    update = dict(info)
+                    for panel in subscription['panels']:
+                        if panel == 'preprocessed_assembly':
+                            continue
+                        key = (panel, subscription['memory_pages']) if panel == 'data_memory' else panel
+                        if key not in panels:
+                            panels[key] = self.return_panel(panel, subscription['memory_pages'])
+                        update[panel] = panels[key]
+
+                if 'preprocessed_assembly' in subscription['panels'] and subscription['program_version'] != program_version:
+                    # Only sent once per program version, always as JSON
+                    subscription['program_version'] = program_version
+                    if 'preprocessed_assembly' not in panels:
+                        panels['preprocessed_assembly'] = self.return_panel('preprocessed_assembly')
+                    update['preprocessed_assembly'] = panels['preprocessed_assembly']
+
+                if 'binary' in update:
+                    wire_format_name = 'binary'
+                    metrics.binary_message_bytes += len(update['binary'])
+                else:
+                    wire_format_name = 'json'
+                    metrics.json_message_bytes += len(json.dumps(update))  # What Socket.IO sends (it serializes the update itself)
+                encoded = time.perf_counter()
+                metrics.encode_seconds[wire_format_name] += encoded - start
+
+                socketio.emit('simulation_update', update, to=sid)
+
+                metrics.messages[wire_format_name] += 1
+                metrics.send_seconds[wire_format_name] += time.perf_counter() - encoded
+
+        return info
+
+    def emit_timing_report(self) -> None:
+        processed_lines = self.preprocess_assembly()
+
+        socketio.emit('timing_report', {
+            'static': timing_model.estimate_program(processed_lines, TIMING_MODEL),
+            'simulated': timing_model.estimate_program(processed_lines, TIMING_MODEL, self.tick_profile)
+        })
 
     def generate_schematic(self) -> tuple[str, int]:
         try:
-            generator.generate(assembly_file=SAVE_PATH)
+            generator.generate(assembly_file=SAVE_PATH, optimize=OPTIMIZE_ASSEMBLY,
+                               verify=self.verify_machine_code if VERIFY_MACHINE_CODE else None)
         except Exception as error:
-            self.display_error_message(error)
+            self.display_error_message(str(error))
             return '', 500  # Internal Server Error
         else:
             socketio.emit('generate_schematic_successful')
 
         return '', 204  # No Content
 
+    def verify_machine_code(self, machine_code: list[str]) -> None:
+        report = machine_code_simulator.lockstep_check(machine_code, lambda rng: Simulator(1, rng), self.load_program().instructions,
+                                                       VERIFY_CYCLES)
+        if report['divergence'] is not None:
+            raise ValueError(machine_code_simulator.format_divergence(report['divergence']))
+
     def display_error_message(self, message) -> None:
         socketio.emit('error_message', {'message': message})
 
@@ -547,6 +694,18 @@ def handle_update_speed(data) -> None:
     speed = data.get('speed')
     print(f'Updating speed from {simulator.speed} -> {speed}')
     simulator.speed = int(speed)
+    simulator.hardware_speed = bool(data.get('hardware', False))
+    simulator.wake_event.set()
+
+
+@socketio.on('request_timing_report')
+def handle_request_timing_report() -> None:
+    simulator.emit_timing_report()
+
+
+@socketio.on('request_stats')
+def handle_request_stats() -> None:
+    socketio.emit('simulation_stats', metrics.summary(len(subscriptions), threading.active_count()), to=request.sid)
 
 
 @socketio.on('request_update')
@@ -555,36 +714,115 @@ def handle_request_update() -> None:
     simulator.return_info(emit=True)
 
 
+@socketio.on('connect')
+def handle_connect(auth=None) -> None:
+    # Until the client subscribes, it gets everything
+    subscriptions[request.sid] = {'panels': list(PANELS), 'memory_pages': (0, MEMORY_PAGES - 1), 'program_version': -1}
+
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None) -> None:
+    subscriptions.pop(request.sid, None)
+
+
+@socketio.on('subscribe')
+def handle_subscribe(data) -> None:
+    # Malformed subscriptions are ignored (the client keeps its previous one), checked before anything gets changed
+    if not isinstance(data, dict) or not isinstance(data.get('panels', []), list):
+        return
+    memory_pages = data.get('memory_pages', [0, MEMORY_PAGES - 1])
+    if not isinstance(memory_pages, list) or len(memory_pages) != 2 or not all(type(page) is int for page in memory_pages):
+        return
+
+    first_page, last_page = memory_pages
+    first_page = min(max(first_page, 0), MEMORY_PAGES - 1)
+    last_page = min(max(int(last_page), first_page), MEMORY_PAGES - 1)
+
+    subscription = subscriptions.setdefault(request.sid, {'program_version': -1})
+    subscription['panels'] = [panel for panel in data.get('panels', []) if panel in PANELS]
+    subscription['memory_pages'] = (first_page, last_page)
+    subscription['binary'] = bool(data.get('binary', False))  # Otherwise JSON (for debugging)
+
+    simulator.return_info(emit=True)
+
+
 @socketio.on('controller_update')
 def handle_controller_update(data) -> None:
     # print(f'controller update: {data}')
     controller_data = data.get('controller')
     # print(f'frontend: {controller_data} sent this.')
-    simulator.controller = {'UP': controller_data['UP'], 'RIGHT': controller_data['RIGHT'],
-                            'DOWN': controller_data['DOWN'], 'LEFT': controller_data['LEFT'],
-                            'START': (controller_data['START'] or simulator.controller['START']),
-                            'SELECT': (controller_data['SELECT'] or simulator.controller['SELECT']),
-                            'Y': (controller_data['Y'] or simulator.controller['Y']),
-                            'X': (controller_data['X'] or simulator.controller['X'])}
-    value = (8 * '0' + str(simulator.controller['X']) + str(simulator.controller['Y']) +
-             str(simulator.controller['SELECT']) + str(simulator.controller['START']) +
-             str(simulator.controller['LEFT']) + str(simulator.controller['DOWN']) +
-             str(simulator.controller['RIGHT']) + str(simulator.controller['UP']))
-    simulator.PORTS_READ_ONLY['P0'] = value
+    simulator.controller.press(controller_data)  # D-Pad as sent, Start / Select / Y / X stay pressed until loaded
+    simulator.wake_event.set()
     simulator.return_info(emit=True)
     # print(f'backend: {simulator.controller} updated this.')
 
 
+def emit_stats() -> None:
+    socketio.emit('simulation_stats', metrics.summary(len(subscriptions), threading.active_count()))
+
+
+def program_changed() -> None:
+    global program_version
+    program_version += 1
+
+
 @app.route('/save', methods=['POST'])
 def save_via_fetch() -> tuple[str, int]:
     code_input = request.form.get('codeInput', '').replace('\r\n', '\n').rstrip()
     with open(SAVE_PATH, 'w') as f:
         f.write(code_input)
 
+    program_changed()
     simulator.reset_simulation()
     return '', 204
 
 
+@app.route('/metrics', methods=['GET'])
+def runtime_metrics_text() -> tuple[str, int, dict[str, str]]:  # Prometheus text format
+    return (metrics.to_prometheus(len(subscriptions), threading.active_count()), 200,
+            {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+@app.route('/programs', methods=['GET'])
+def list_programs() -> dict[str, list[dict[str, str]]]:
+    return {'programs': library.list_programs()}
+
+
+@app.route('/programs/load', methods=['POST'])
+def load_program() -> tuple[str, int]:
+    try:
+        content = library.read(request.form.get('directory', ''), request.form.get('name', ''))
+    except ValueError as error:  # Not a program of the library
+        simulator.display_error_message(f'Fatal Error. {error}')
+        return '', 400
+    except FileNotFoundError as error:
+        simulator.display_error_message(f'Fatal Error. {error}')
+        return '', 404
+
+    content = content.replace('\r\n', '\n').rstrip()
+    with open(SAVE_PATH, 'w') as f:
+        f.write(content)
+
+    program_changed()
+    simulator.reset_simulation()  # Compiled programs are cached, switching back to a program is instant
+
+    socketio.emit('update_code', {'content': content})
+
+    return '', 204
+
+
+@app.route('/programs/save', methods=['POST'])
+def save_program() -> tuple[str, int]:
+    code_input = request.form.get('codeInput', '').replace('\r\n', '\n').rstrip()
+    try:
+        library.save(request.form.get('name', ''), code_input)
+    except ValueError as error:
+        simulator.display_error_message(f'Fatal Error. {error}')
+        return '', 400
+
+    return '', 204
+
+
 @app.route('/', methods=['GET'])
 def ui_index() -> str:  # returns flask template (str)
     saved_code = ''
@@ -594,23 +832,23 @@ def ui_index() -> str:  # returns flask template (str)
     except FileNotFoundError:
         simulator.display_error_message(f'Fatal Error. File "{SAVE_PATH}"was not found. Perhaps create it?')
 
-    decimal_info_list = simulator.return_info(emit=False)
+    info = simulator.return_info(emit=False)
 
-    return render_template(
+    return render_template(  # Data Memory & the program listing are loaded by the client (see handle_subscribe)
         'index.html',
         saved_text=saved_code,
-        registers=decimal_info_list[0],
-        ps=decimal_info_list[1],
-        pd=decimal_info_list[2],
-        data_memory=decimal_info_list[3],
-        alu_flags=decimal_info_list[4],
-        pc=decimal_info_list[5],
-        call_stack=decimal_info_list[6],
-        screen_data=decimal_info_list[7],
-        letters=decimal_info_list[8],
-        number=decimal_info_list[9],
-        big_number=decimal_info_list[13],
-        preprocessed_assembly=simulator.preprocess_assembly()
+        registers=simulator.return_panel('registers'),
+        ps=simulator.return_panel('ps'),
+        pd=simulator.return_panel('pd'),
+        memory_pages=MEMORY_PAGES,
+        alu_flags=simulator.return_panel('alu_flags'),
+        pc=info['pc'],
+        call_stack=simulator.return_panel('call_stack'),
+        screen_data=info['screen_data'],
+        letters=info['letters'],
+        number=info['number'],
+        big_number=info['big_number'],
+        in_game_time=info['in_game_time']
     )
 
 
@@ -625,6 +863,7 @@ def upload() -> tuple[str, int]:
         with open(SAVE_PATH, 'w') as f:
             f.write(content)
 
+    program_changed()
     simulator.reset_simulation()
 
     socketio.emit('update_code', {'content': content})
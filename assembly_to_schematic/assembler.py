@@ -23,6 +23,9 @@ OPCODES = {'NOP': '00000',
            'HLT': '10011'
            }
 
+JUMP_INSTRUCTIONS = ['JMP', 'CAL', 'BEQ', 'BNE', 'BLT', 'BGT']  # Instructions with an absolute target address
+FLAG_INSTRUCTIONS = ['ADD', 'SUB', 'XOR', 'OR', 'AND', 'RSH', 'ADI']  # Instructions updating the ALU flags
+
 
 def read_assembly_file(assembly_file):
     with open(assembly_file, 'r') as file:
@@ -142,6 +145,148 @@ def preprocess_assembly(assembly_file):
     return lines
 
 
+def branch_entries(instructions):
+    # Addresses that can be entered from somewhere else than the previous instruction
+    entries = set()
+    for address, parts in enumerate(instructions):
+        if parts[0] in JUMP_INSTRUCTIONS:
+            entries.add(int(parts[1]))
+        if parts[0] == 'CAL':
+            entries.add(address + 1)  # Return address
+    return entries
+
+
+def remove_instructions(instructions, removed):
+    # Removes the given addresses and moves every jump target to its new address
+    # (A target pointing at a removed instruction now points at the next remaining one)
+    new_addresses = []
+    kept = 0
+    for address in range(len(instructions) + 1):
+        new_addresses.append(kept)
+        if address not in removed:
+            kept += 1
+
+    result = []
+    for address, parts in enumerate(instructions):
+        if address in removed:
+            continue
+        if parts[0] in JUMP_INSTRUCTIONS and int(parts[1]) < len(new_addresses):
+            parts = [parts[0], str(new_addresses[int(parts[1])])]
+        result.append(parts)
+    return result
+
+
+def flags_are_overwritten(instructions, address):
+    # True if the ALU flags set at address are overwritten before any instruction could read them
+    for parts in instructions[address + 1:]:
+        if parts[0] in FLAG_INSTRUCTIONS:
+            return True
+        if parts[0] not in ['NOP', 'ST', 'LD', 'PT-ST', 'PT-LD']:
+            return False  # Jumps, Branches, Returns and Halts may depend on the flags
+    return False
+
+
+def thread_jumps(instructions):
+    threaded = 0
+    for address, parts in enumerate(instructions):
+        if parts[0] not in JUMP_INSTRUCTIONS:
+            continue
+        target = int(parts[1])
+        visited = {address}
+        while target < len(instructions) and instructions[target][0] == 'JMP' and target not in visited:
+            visited.add(target)
+            target = int(instructions[target][1])
+        if target != int(parts[1]):
+            instructions[address] = [parts[0], str(target)]
+            threaded += 1
+    return instructions, threaded
+
+
+def find_unreachable(instructions):
+    reachable = set()
+    pending = [0]
+    while pending:
+        address = pending.pop()
+        if address in reachable or address >= len(instructions):
+            continue
+        reachable.add(address)
+        operation = instructions[address][0]
+        if operation in JUMP_INSTRUCTIONS:
+            pending.append(int(instructions[address][1]))
+        if operation not in ['JMP', 'RET', 'HLT']:  # CAL continues at the return address
+            pending.append(address + 1)
+    return {address for address in range(len(instructions)) if address not in reachable}
+
+
+def fold_adi_chains(instructions):
+    entries = branch_entries(instructions)
+    folded = set()
+    for address in range(len(instructions) - 1):
+        first, second = instructions[address], instructions[address + 1]
+        if address in folded or address + 1 in entries or first[0] != 'ADI' or second[0] != 'ADI':
+            continue
+        if first[1] == second[1] == second[2] and first[1] != 'R0':  # ADI RX RY A, ADI RX RX B -> ADI RX RY (A + B)
+            instructions[address] = ['ADI', first[1], first[2], str((int(first[3]) + int(second[3])) & 0xFFFF)]
+            folded.add(address + 1)
+    return folded
+
+
+def find_r0_writes(instructions):
+    # r0 is reset to 0 after every instruction, only writes without other side effects can be dropped
+    removed = set()
+    for address, parts in enumerate(instructions):
+        if len(parts) < 2 or parts[1] != 'R0':
+            continue
+        if parts[0] in FLAG_INSTRUCTIONS and flags_are_overwritten(instructions, address):
+            removed.add(address)
+        elif parts[0] == 'LD' and parts[2] == 'R0' and 0 <= int(parts[3]) < 256:  # Other addresses might be out of range (fault)
+            removed.add(address)
+        elif parts[0] == 'PT-LD' and int(parts[2][1:]) & 0b111 > 1:  # Controller (P0) and Random (P1) reads are kept
+            removed.add(address)
+    return removed
+
+
+def find_jumps_to_next(instructions):
+    return {address for address, parts in enumerate(instructions)
+            if parts[0] in JUMP_INSTRUCTIONS and parts[0] != 'CAL' and int(parts[1]) == address + 1}
+
+
+def optimize_assembly(lines):
+    # Peephole optimizer for preprocessed assembly (labels already resolved to addresses)
+    # Returns the optimized lines and a report of what was changed
+    instructions = [line.upper().split() for line in lines]
+    report = {'instructions_before': len(instructions), 'instructions_after': 0, 'removed_nops': 0,
+              'removed_dead_code': 0, 'folded_adi': 0, 'threaded_jumps': 0, 'removed_r0_writes': 0,
+              'removed_jumps_to_next': 0, 'static_instructions_saved': 0}
+
+    changed = True
+    while changed:
+        instructions, threaded = thread_jumps(instructions)
+        report['threaded_jumps'] += threaded
+
+        passes = [('removed_dead_code', find_unreachable),
+                  ('removed_nops', lambda program: {address for address, parts in enumerate(program) if parts[0] == 'NOP'}),
+                  ('folded_adi', fold_adi_chains),
+                  ('removed_r0_writes', find_r0_writes),
+                  ('removed_jumps_to_next', find_jumps_to_next)]
+
+        changed = threaded > 0
+        for key, find_removable in passes:
+            removed = find_removable(instructions)
+            if removed:
+                instructions = remove_instructions(instructions, removed)
+                report[key] += len(removed)
+                changed = True
+
+    report['instructions_after'] = len(instructions)
+    # Removed reachable instructions / skipped jumps, not cycles: Each saves one cycle every time it would have been executed
+    # (measure the cycles with batch_simulator.differential_check)
+    report['static_instructions_saved'] = (report['removed_nops'] + report['folded_adi'] + report['threaded_jumps'] +
+                                           report['removed_r0_writes'] + report['removed_jumps_to_next'])
+
+    return [' '.join(parts) for parts in instructions], report
+
+
 def translate_instruction_to_machine_code(instruction):
     parts = instruction.split()
     opcode = OPCODES[parts[0]]
@@ -172,7 +317,7 @@ def translate_instruction_to_machine_code(instruction):
         raise ValueError(f'{Fore.RED}Fatal Error. Instruction {instruction} not found.{Style.RESET_ALL}')
 
 
-def generate_machine_code(assembly_file) -> list[str]:
+def generate_machine_code(assembly_file, optimize=False) -> list[str]:
     machine_code = []
 
     try:
@@ -180,6 +325,11 @@ def generate_machine_code(assembly_file) -> list[str]:
     except FileNotFoundError:
         raise FileNotFoundError('Fatal Error. File "{assembly_file}"was not found. Perhaps create it?')
 
+    if optimize:
+        processed_lines, report = optimize_assembly(processed_lines)
+        print(f'{Fore.LIGHTGREEN_EX}Optimized: {report["instructions_before"]} -> {report["instructions_after"]} Instructions, '
+              f'{report["static_instructions_saved"]} reachable Instructions removed / skipped. ({report}){Style.RESET_ALL}')
+
     for line in processed_lines:
         machine_code.append(translate_instruction_to_machine_code(line.upper()))
 
@@ -4,11 +4,14 @@ from . import schematic_generator
 # This Script converts FROSTBYTE Assembler -> Schematic for the FROSTBYTE CPU
 #
 # Enter your assembly_to_schematic code (into the specified assembly_file)
-# Then it gets converted to machine code (gets returned from generate_machine_code)
+# Then it gets converted to machine code (gets returned from generate_machine_code), optionally optimized by a peephole optimizer
 # Then it gets converted to a Minecraft Schematic that you can paste in with Worldedit (into programs/Program_[Time])
 
-def generate(assembly_file: str) -> None:
-    machine_code = assembler.generate_machine_code(assembly_file)
+def generate(assembly_file: str, optimize: bool = False, verify=None) -> None:
+    # verify: Called with the machine code before the schematic gets generated, raises to stop (see app.py VERIFY_MACHINE_CODE)
+    machine_code = assembler.generate_machine_code(assembly_file, optimize=optimize)
+    if verify is not None:
+        verify(machine_code)
     schematic_generator.generate_schematic(machine_code)
 
 
@@ -0,0 +1,353 @@
+import numpy as np
+from colorama import Fore, Style
+
+from assembly_to_schematic import assembler
+
+# Runs many FROSTBYTE machines ("lanes") in lockstep on the same program.
+#
+# Every lane holds its own machine state in NumPy arrays (registers, data memory, ports, flags, call stack, I/O devices).
+# Each step, lanes sitting on the same program counter are executed together with vectorized operations,
+# lanes that diverged on a branch are simply executed as separate groups (per-lane masking).
+# The opcode semantics mirror Simulator.execute_instruction / port_store / port_load in app.py.
+#
+# Lanes only differ in their inputs:
+# - seeds: the random port (P1) of a lane returns a deterministic pseudo random stream derived from its seed
+# - controller_scripts: the n-th read of the controller port (P0) of a lane returns controller_scripts[lane][n]
+#   (the last value is repeated once the script runs out)
+# Both inputs are indexed by the number of reads (not by cycle), so a run is reproducible.
+
+OPCODE_IDS: dict[str, int] = {operation: int(opcode, 2) for operation, opcode in assembler.OPCODES.items()}
+
+NOP, ADD, SUB, XOR, OR, AND, RSH, ADI, ST, LD, PT_ST, PT_LD, JMP, CAL, RET, BEQ, BNE, BLT, BGT, HLT = (
+    OPCODE_IDS[operation] for operation in ['NOP', 'ADD', 'SUB', 'XOR', 'OR', 'AND', 'RSH', 'ADI', 'ST', 'LD', 'PT-ST',
+                                            'PT-LD', 'JMP', 'CAL', 'RET', 'BEQ', 'BNE', 'BLT', 'BGT', 'HLT'])
+
+ALU_FLAG_NAMES: list[str] = ['BEQ', 'BNE', 'BLT', 'BGT']  # Column order of BatchSimulator.alu_flags
+BRANCH_FLAGS: dict[int, int] = {BEQ: 0, BNE: 1, BLT: 2, BGT: 3}
+
+CALL_STACK_DEPTH: int = 16
+SCREEN_SIZE: int = 31
+LETTERS: int = 11
+NO_LETTER: int = -1  # Rendered as '_'
+
+
+def decode_operand(token: str) -> int:
+    if token[0] in 'RP':  # Register (R0 - R31) or Port (P0 - P7)
+        return int(token[1:])
+    return int(token)
+
+
+def decode_instruction(instruction: str) -> tuple[int, int, int, int]:
+    parts = instruction.upper().split()
+
+    if parts[0] not in OPCODE_IDS:
+        raise ValueError(f'{Fore.RED}Fatal Error. Instruction {instruction} not found.{Style.RESET_ALL}')
+
+    operands = [decode_operand(part) for part in parts[1:]] + [0, 0, 0]
+
+    if parts[0] == 'ADI':
+        operands[2] &= 0xFFFF  # (value + immediate) & 0xFFFF == value + (immediate & 0xFFFF) in 16 Bit
+
+    return OPCODE_IDS[parts[0]], operands[0], operands[1], operands[2]
+
+
+def decode_program(lines: list[str]) -> list[tuple[int, int, int, int]]:
+    return [decode_instruction(line) for line in lines]
+
+
+def splitmix64(values: np.ndarray) -> np.ndarray:
+    with np.errstate(over='ignore'):
+        values = values + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+class BatchSimulator:
+    def __init__(self, lines: list[str], lanes: int, seeds: list[int] | np.ndarray | None = None,
+                 controller_scripts: list[list[int]] | np.ndarray | None = None):
+        self.program: list[tuple[int, int, int, int]] = decode_program(lines)
+        self.lanes: int = lanes
+
+        self.registers: np.ndarray = np.zeros((lanes, 32), dtype=np.uint16)
+        self.data_memory: np.ndarray = np.zeros((lanes, 256), dtype=np.uint16)
+        self.ports_write_only: np.ndarray = np.zeros((lanes, 8), dtype=np.uint16)
+        self.alu_flags: np.ndarray = np.zeros((lanes, 4), dtype=bool)
+        self.call_stack: np.ndarray = np.zeros((lanes, CALL_STACK_DEPTH), dtype=np.int32)
+        self.call_stack_size: np.ndarray = np.zeros(lanes, dtype=np.int32)
+        self.program_counter: np.ndarray = np.zeros(lanes, dtype=np.int32)
+
+        self.running: np.ndarray = np.ones(lanes, dtype=bool)
+        self.halted: np.ndarray = np.zeros(lanes, dtype=bool)
+        self.cycles: np.ndarray = np.zeros(lanes, dtype=np.int64)  # Executed instructions per lane
+        self.halt_cycles: np.ndarray = np.full(lanes, -1, dtype=np.int64)  # -1: Did not halt (yet)
+        self.errors: dict[int, str] = {}
+
+        self.screen_data: np.ndarray = np.zeros((lanes, SCREEN_SIZE, SCREEN_SIZE), dtype=np.uint8)
+        self.screen_buffer: np.ndarray = np.zeros((lanes, SCREEN_SIZE, SCREEN_SIZE), dtype=np.uint8)
+        self.screen_d_latch_data: np.ndarray = np.zeros(lanes, dtype=np.uint8)
+        self.screen_x: np.ndarray = np.zeros(lanes, dtype=np.int32)
+        self.screen_y: np.ndarray = np.zeros(lanes, dtype=np.int32)
+        self.letters_data: np.ndarray = np.full((lanes, LETTERS), NO_LETTER, dtype=np.int8)
+        self.letters_buffer: np.ndarray = np.full((lanes, LETTERS), NO_LETTER, dtype=np.int8)
+        self.letters_pointer: np.ndarray = np.zeros(lanes, dtype=np.int32)
+        self.letters_aliased: np.ndarray = np.zeros(lanes, dtype=bool)  # Shown letters are the buffer (update without clear)
+        self.number_written: np.ndarray = np.zeros(lanes, dtype=bool)
+
+        self.seeds: np.ndarray = np.asarray(seeds if seeds is not None else np.arange(lanes), dtype=np.uint64)
+        self.random_reads: np.ndarray = np.zeros(lanes, dtype=np.uint64)
+
+        if controller_scripts is None:
+            controller_scripts = np.zeros((lanes, 1), dtype=np.uint16)
+        self.controller_scripts: np.ndarray = np.asarray(controller_scripts, dtype=np.uint16)
+        self.controller_reads: np.ndarray = np.zeros(lanes, dtype=np.int64)
+
+        if self.seeds.shape != (lanes,):
+            raise ValueError(f'{Fore.RED}Fatal Error. Expected {lanes} seeds, got {self.seeds.shape}.{Style.RESET_ALL}')
+        if self.controller_scripts.ndim != 2 or self.controller_scripts.shape[0] != lanes or self.controller_scripts.shape[1] == 0:
+            raise ValueError(f'{Fore.RED}Fatal Error. Expected {lanes} non-empty controller scripts, got {self.controller_scripts.shape}.{Style.RESET_ALL}')
+
+    def fault(self, lanes: np.ndarray, message: str) -> None:
+        self.running[lanes] = False
+        for lane in lanes.tolist():
+            self.errors[lane] = message
+
+    def update_alu_flags(self, lanes: np.ndarray, result: np.ndarray) -> None:
+        # Minecraft Implementation (see Simulator.update_alu_flags)
+        beq = result == 0
+        blt = (result >> 15) == 1
+        self.alu_flags[lanes, 0] = beq
+        self.alu_flags[lanes, 1] = ~beq
+        self.alu_flags[lanes, 2] = blt
+        self.alu_flags[lanes, 3] = ~beq & ~blt
+
+    def step(self) -> int:
+        active = np.flatnonzero(self.running)
+
+        if not active.size:
+            return 0
+
+        pcs = self.program_counter[active]
+        outside = pcs >= len(self.program)
+        if outside.any():
+            self.fault(active[outside], 'No halt at the end of the program')
+            active, pcs = active[~outside], pcs[~outside]
+
+        if active.size and pcs.min() == pcs.max():  # All lanes in lockstep
+            self.execute_instruction(self.program[pcs[0]], active)
+        elif active.size:  # Divergent lanes, execute each program counter as its own group
+            order = np.argsort(pcs, kind='stable')
+            active, pcs = active[order], pcs[order]
+            for group in np.split(active, np.flatnonzero(np.diff(pcs)) + 1):
+                self.execute_instruction(self.program[self.program_counter[group[0]]], group)
+
+        self.registers[active, 0] = 0  # Make sure r0 is always 0
+        self.data_memory[active, 0] = 0  # Make sure d0 is always 0
+        # Like MachineCodeSimulator, an instruction that faults doesn't complete, so it isn't counted as a cycle
+        executed = active[self.running[active] | self.halted[active]]
+        self.cycles[executed] += 1
+
+        halted_now = executed[self.halted[executed] & (self.halt_cycles[executed] < 0)]
+        self.halt_cycles[halted_now] = self.cycles[halted_now]
+
+        return int(active.size)
+
+    def run(self, max_cycles: int) -> np.ndarray:
+        for _ in range(max_cycles):
+            if not self.step():
+                break
+
+        return self.halt_cycles
+
+    def execute_instruction(self, instruction: tuple[int, int, int, int], lanes: np.ndarray) -> None:
+        operation, a, b, c = instruction
+        next_pc = self.program_counter[lanes] + 1
+
+        if operation == NOP:
+            pass
+        elif operation <= ADI:  # ALU & Immediate Instructions
+            left = self.registers[lanes, b]
+
+            if operation == ADD:
+                result = left + self.registers[lanes, c]
+            elif operation == SUB:
+                result = left - self.registers[lanes, c]
+            elif operation == XOR:
+                result = left ^ self.registers[lanes, c]
+            elif operation == OR:
+                result = left | self.registers[lanes, c]
+            elif operation == AND:
+                result = left & self.registers[lanes, c]
+            elif operation == RSH:
+                result = left >> 1
+            else:  # ADI
+                result = left + np.uint16(c)
+
+            self.registers[lanes, a] = result
+            self.update_alu_flags(lanes, result)
+        elif operation in (ST, LD):
+            addresses = self.registers[lanes, b].astype(np.int64) + c
+            outside = (addresses < 0) | (addresses >= self.data_memory.shape[1])  # Negative offsets can reach below D0
+            if outside.any():  # Like the Simulator (unknown address), no wrap around (NumPy would wrap negative indices)
+                self.fault(lanes[outside], 'Data memory address out of range')
+                lanes, addresses, next_pc = lanes[~outside], addresses[~outside], next_pc[~outside]
+            if operation == ST:
+                self.data_memory[lanes, addresses] = self.registers[lanes, a]
+            else:
+                self.registers[lanes, a] = self.data_memory[lanes, addresses]
+        elif operation == PT_ST:
+            self.port_store(lanes, b, self.registers[lanes, a])
+        elif operation == PT_LD:
+            self.port_load(lanes, b, a)
+        elif operation == JMP:
+            next_pc[:] = a
+        elif operation == CAL:
+            full = lanes[self.call_stack_size[lanes] == CALL_STACK_DEPTH]
+            if full.size:  # Max 16 Layers Deep, the oldest return address is dropped
+                self.call_stack[full, :-1] = self.call_stack[full, 1:]
+                self.call_stack_size[full] -= 1
+            self.call_stack[lanes, self.call_stack_size[lanes]] = next_pc
+            self.call_stack_size[lanes] += 1
+            next_pc[:] = a
+        elif operation == RET:
+            empty = self.call_stack_size[lanes] == 0
+            if empty.any():
+                self.fault(lanes[empty], 'Return with an empty call stack')
+                lanes, next_pc = lanes[~empty], next_pc[~empty]
+            self.call_stack_size[lanes] -= 1
+            next_pc = self.call_stack[lanes, self.call_stack_size[lanes]]
+        elif operation in BRANCH_FLAGS:
+            next_pc = np.where(self.alu_flags[lanes, BRANCH_FLAGS[operation]], a, next_pc)
+        elif operation == HLT:
+            self.running[lanes] = False
+            self.halted[lanes] = True
+            next_pc -= 1  # In case Program gets continued again, Halt will be spammed
+
+        self.program_counter[lanes] = next_pc
+
+    def port_load(self, lanes: np.ndarray, address: int, register: int) -> None:
+        device = address & 0b111
+
+        if device == 0:  # Controller
+            reads = np.minimum(self.controller_reads[lanes], self.controller_scripts.shape[1] - 1)
+            self.registers[lanes, register] = self.controller_scripts[lanes, reads]
+            self.controller_reads[lanes] += 1
+        elif device == 1:  # Random Number
+            values = splitmix64(self.seeds[lanes] * np.uint64(0x100000001B3) + self.random_reads[lanes])
+            self.registers[lanes, register] = (values & np.uint64(0xFFFF)).astype(np.uint16)
+            self.random_reads[lanes] += np.uint64(1)
+        else:
+            self.registers[lanes, register] = 0
+
+    def port_store(self, lanes: np.ndarray, address: int, values: np.ndarray) -> None:
+        device = address & 0b111
+
+        self.ports_write_only[lanes, device] = values
+
+        if device == 0:  # Format: XXXXXXXXXXXXXX (14), Clear Letter Buffer (1), Update Letter Buffer (1)
+            # The Simulator shows the buffer itself after an update, until it gets cleared (letters_data = letters_buffer)
+            update = lanes[(values & 0b1) != 0]
+            self.letters_data[update] = self.letters_buffer[update]
+            self.letters_aliased[update] = True
+            clear = lanes[(values & 0b10) != 0]
+            self.letters_pointer[clear] = 0
+            self.letters_buffer[clear] = NO_LETTER
+            self.letters_aliased[clear] = False
+        elif device == 1:  # Format: XXXXXXXXXXX (11), Character (5)
+            characters = (values & 0b11111).astype(np.int8)
+            unknown = characters > 26
+            if unknown.any():
+                self.fault(lanes[unknown], 'Character not in supported characters (A-Z, Space)')
+                lanes, characters = lanes[~unknown], characters[~unknown]
+            self.letters_buffer[lanes, self.letters_pointer[lanes]] = characters
+            aliased = self.letters_aliased[lanes]
+            self.letters_data[lanes[aliased], self.letters_pointer[lanes[aliased]]] = characters[aliased]
+            self.letters_pointer[lanes] = (self.letters_pointer[lanes] + 1) % LETTERS
+        elif device == 2:  # Format: XXXXXX (6), Sign Mode (1), Enable (1), Number (8)
+            self.number_written[lanes] = True
+        elif device == 3:  # Format: XXXXXX (6), X (5), Y (5)
+            self.screen_x[lanes] = (values >> 5) & 0b11111
+            self.screen_y[lanes] = values & 0b11111
+        elif device == 4:  # Draws the Pixel on store with any value
+            x, y = self.screen_x[lanes], self.screen_y[lanes]
+            inside = (x > 0) & (y > 0)  # Coordinates must be in range [1;31]
+            lanes, x, y = lanes[inside], x[inside], y[inside]
+            self.screen_buffer[lanes, SCREEN_SIZE - y, SCREEN_SIZE - x] = self.screen_d_latch_data[lanes]
+        elif device == 5:  # Format: XXXXXXXXXXXXXXX (15), Screen Data Value (1)
+            self.screen_d_latch_data[lanes] = values & 0b1
+        elif device == 6:  # Sets all Pixels on store with any value
+            self.screen_buffer[lanes] = self.screen_d_latch_data[lanes, None, None]
+        elif device == 7:  # Pushes the Buffer on store with any value
+            self.screen_data[lanes] = self.screen_buffer[lanes]
+
+    def lane_state(self, lane: int) -> dict:
+        number_value = int(self.ports_write_only[lane, 2])
+        number, big_number = '___', '_____'
+
+        if self.number_written[lane]:
+            number = format(number_value & 0xFF, '03d')
+            big_number = format(number_value, '05d')
+            if number_value & 0b1000000000 and int(number) >= 128:  # Sign Mode
+                number = format(int(number) - 256, '04d')
+            if not number_value & 0b100000000:  # Disable
+                number = '___'
+
+        return {
+            'pc': int(self.program_counter[lane]),
+            'registers': self.registers[lane].tolist(),
+            'pd': self.ports_write_only[lane].tolist(),
+            'data_memory': self.data_memory[lane].tolist(),
+            'alu_flags': dict(zip(ALU_FLAG_NAMES, self.alu_flags[lane].tolist())),
+            'call_stack': self.call_stack[lane, :self.call_stack_size[lane]].tolist(),
+            'screen_data': self.screen_data[lane].tolist(),
+            'letters': ''.join('_' if char == NO_LETTER else num_to_char(char) for char in self.letters_data[lane].tolist()),
+            'number': number,
+            'big_number': big_number,
+            'halted': bool(self.halted[lane]),
+            'halt_cycle': int(self.halt_cycles[lane]),
+            'cycles': int(self.cycles[lane]),
+            'error': self.errors.get(lane)
+        }
+
+
+def num_to_char(num: int) -> str:
+    return ' ' if num == 0 else chr(ord('A') + num - 1)
+
+
+def simulate_file(assembly_file: str, lanes: int, max_cycles: int, seeds: list[int] | np.ndarray | None = None,
+                  controller_scripts: list[list[int]] | np.ndarray | None = None) -> BatchSimulator:
+    batch = BatchSimulator(assembler.preprocess_assembly(assembly_file), lanes, seeds, controller_scripts)
+    batch.run(max_cycles)
+    return batch
+
+
+def differential_check(original_lines: list[str], optimized_lines: list[str], lanes: int, max_cycles: int,
+                       seeds: list[int] | np.ndarray | None = None,
+                       controller_scripts: list[list[int]] | np.ndarray | None = None) -> dict[str, int | list[int]]:
+    # Runs both programs with the same inputs and compares the observable state of every lane that halted
+    # (Cycle counts and code addresses are expected to differ, so only the depth of the call stack is compared)
+    # result: 'inconclusive' if no lane halted in both programs within max_cycles (nothing was compared)
+    original = BatchSimulator(original_lines, lanes, seeds, controller_scripts)
+    optimized = BatchSimulator(optimized_lines, lanes, seeds, controller_scripts)
+    original.run(max_cycles)
+    optimized.run(max_cycles)
+
+    ignored = ['pc', 'cycles', 'halt_cycle', 'call_stack']
+    mismatches: list[int] = []
+    compared = 0
+    cycles_saved = 0
+
+    for lane in range(lanes):
+        if original.running[lane] or optimized.running[lane]:
+            continue  # Did not finish within max_cycles, nothing to compare
+        compared += 1
+        original_state = {key: value for key, value in original.lane_state(lane).items() if key not in ignored}
+        optimized_state = {key: value for key, value in optimized.lane_state(lane).items() if key not in ignored}
+        if original_state != optimized_state or original.call_stack_size[lane] != optimized.call_stack_size[lane]:
+            mismatches.append(lane)
+        cycles_saved += int(original.halt_cycles[lane] - optimized.halt_cycles[lane])
+
+    result = 'failed' if mismatches else 'passed' if compared else 'inconclusive'
+    return {'result': result, 'compared_lanes': compared, 'mismatched_lanes': mismatches,
+            'cycles_saved_per_run': cycles_saved / compared if compared else 0.0,
+            'original_cycles': int(original.cycles.sum()), 'optimized_cycles': int(optimized.cycles.sum())}
@@ -0,0 +1,244 @@
+import functools
+import random
+
+# Memory-mapped I/O devices of the FROSTBYTE CPU
+#
+# Devices are objects registered at port addresses of an IOBus. PT-ST / PT-LD dispatch on the (integer) port number
+# with a list lookup. Every simulator builds its bus with create_bus() from DEVICES, so adding a device
+# (e.g. a sound or keyboard peripheral) only means adding it there (or appending to it before the simulator gets created / reset):
+#
+#     io_devices.DEVICES.append(('keyboard', Keyboard, [], [2]))
+#
+# A device gets called with the index of the port in the list it was registered with (store(index, value) / load(index)),
+# so the same device can be registered at different addresses. Values are 16 Bit integers.
+# Devices set self.dirty whenever their visible state changes, whoever displays the device clears it again.
+# state() returns everything a device stores as a hashable value, the simulator compares it to detect idle (busy-wait) loops.
+
+PORTS: int = 8
+SCREEN_SIZE: int = 31
+LETTERS: int = 11
+
+
+class IODevice:
+    def __init__(self):
+        self.dirty: bool = True
+
+    def store(self, index: int, value: int) -> None:
+        pass
+
+    def load(self, index: int) -> int:
+        return 0
+
+    def peek(self, index: int) -> int:  # Value shown in the UI, without the side effects of load
+        return 0
+
+    def state(self):
+        return object()  # Unknown state: never equal, loops using the device are never treated as idle
+
+
+class IOBus:
+    def __init__(self):
+        self.store_handlers: list = [None] * PORTS
+        self.load_handlers: list = [None] * PORTS
+        self.peek_handlers: list = [None] * PORTS
+        self.written: list[int] = [0] * PORTS  # Last value stored at each port
+        self.stores: int = 0
+        self.devices: list[IODevice] = []
+
+    def register(self, device: IODevice, store_ports: list[int] = (), load_ports: list[int] = ()) -> IODevice:
+        self.devices.append(device)
+        for index, port in enumerate(store_ports):
+            self.store_handlers[port] = functools.partial(device.store, index)
+        for index, port in enumerate(load_ports):
+            self.load_handlers[port] = functools.partial(device.load, index)
+            self.peek_handlers[port] = functools.partial(device.peek, index)
+        return device
+
+    def store(self, port: int, value: int) -> None:
+        port &= 0b111
+        self.written[port] = value
+        self.stores += 1
+        handler = self.store_handlers[port]
+        if handler is not None:
+            handler(value)
+
+    def load(self, port: int) -> int:
+        handler = self.load_handlers[port & 0b111]
+        return handler() if handler is not None else 0
+
+    def peek(self, port: int) -> int:
+        handler = self.peek_handlers[port & 0b111]
+        return handler() if handler is not None else 0
+
+    def state(self) -> tuple:
+        return tuple(self.written), tuple(device.state() for device in self.devices)
+
+
+class Controller(IODevice):
+    # Bit 1 (LSB): D-Pad Up
+    # Bit 2: D-Pad Right
+    # Bit 3: D-Pad Down
+    # Bit 4: D-Pad Left
+    # Bit 5: Start
+    # Bit 6: Select
+    # Bit 7: Y
+    # Bit 8 (MSB): X
+    BUTTONS: list[str] = ['UP', 'RIGHT', 'DOWN', 'LEFT', 'START', 'SELECT', 'Y', 'X']
+    D_PAD_MASK: int = 0b1111  # Start, Select, Y and X stay pressed until they were loaded once
+
+    def __init__(self):
+        super().__init__()
+        self.value: int = 0
+        self.reads: int = 0
+
+    def press(self, buttons: dict[str, int]) -> None:
+        pressed = sum(1 << bit for bit, button in enumerate(self.BUTTONS) if buttons.get(button))
+        self.value = pressed | (self.value & ~self.D_PAD_MASK)
+        self.dirty = True
+
+    def load(self, index: int) -> int:
+        value = self.value
+        self.value &= self.D_PAD_MASK  # bug fix! update the controller buttons AFTER loading it to a register.
+        self.reads += 1
+        self.dirty = True
+        return value
+
+    def peek(self, index: int) -> int:
+        return self.value
+
+    def state(self) -> int:
+        return self.value
+
+
+class RandomNumber(IODevice):
+    # Every load returns a new random 16-bit Number
+    def __init__(self, rng: random.Random | None = None):  # rng: e.g. a seeded random.Random, for reproducible runs
+        super().__init__()
+        self.rng = rng if rng is not None else random
+        self.value: int = self.rng.randint(0, 65535)
+        self.reads: int = 0
+
+    def load(self, index: int) -> int:
+        self.value = self.rng.randint(0, 65535)
+        self.reads += 1
+        self.dirty = True
+        return self.value
+
+    def peek(self, index: int) -> int:
+        return self.value
+
+    def state(self) -> int:
+        return self.value
+
+
+class LetterDisplay(IODevice):
+    # Store ports: Control, Character
+    def __init__(self):
+        super().__init__()
+        self.letters_data: list[str] = ['_' for _ in range(LETTERS)]
+        self.letters_buffer: list[str] = ['_' for _ in range(LETTERS)]
+        self.letters_pointer: int = 0
+
+    def store(self, index: int, value: int) -> None:
+        if index == 0:  # Format: XXXXXXXXXXXXXX (14), Clear Letter Buffer (1), Update Letter Buffer (1)
+            if value & 0b1:  # Update Letter Buffer
+                self.letters_data = self.letters_buffer
+                self.dirty = True
+            if value & 0b10:  # Clear Letter Buffer
+                self.letters_pointer = 0
+                self.letters_buffer = ['_' for _ in range(LETTERS)]
+        else:  # Format: XXXXXXXXXXX (11), Character (5)
+            character = value & 0b11111
+            if character > 26:
+                raise ValueError(f'Character {character} not in supported characters (0: Space, 1-26: A-Z)')
+            self.letters_buffer[self.letters_pointer] = ' ' if character == 0 else chr(ord('A') + character - 1)
+            self.letters_pointer = (self.letters_pointer + 1) % LETTERS
+            self.dirty = True  # The buffer might be shown (after an update without clear)
+
+    def text(self) -> str:
+        return ''.join(self.letters_data)
+
+    def state(self) -> tuple:
+        return tuple(self.letters_data), tuple(self.letters_buffer), self.letters_pointer
+
+
+class NumberDisplay(IODevice):
+    # Format: XXXXXX (6), Sign Mode (1), Enable (1), Number (8)
+    def __init__(self):
+        super().__init__()
+        self.number: str = '___'
+        self.big_number: str = '_____'  # <- 16 Bit Testing Display
+
+    def store(self, index: int, value: int) -> None:
+        low_byte = value & 0xFF
+        self.number = format(low_byte, '03d')
+        self.big_number = format(value, '05d')
+
+        if value & 0b1000000000 and low_byte >= 128:  # Sign Mode
+            self.number = format(low_byte - 256, '04d')
+        if not value & 0b100000000:  # Disable
+            self.number = '___'
+
+        self.dirty = True
+
+    def state(self) -> tuple[str, str]:
+        return self.number, self.big_number
+
+
+class Screen(IODevice):
+    # Store ports: X / Y, Draw Pixel, Screen Data, Set all Pixels, Push Buffer
+    # Every row is stored as an integer, bit n is the pixel in column n
+    FULL_ROW: int = (1 << SCREEN_SIZE) - 1
+
+    def __init__(self):
+        super().__init__()
+        self.rows: list[int] = [0] * SCREEN_SIZE  # What is shown
+        self.buffer_rows: list[int] = [0] * SCREEN_SIZE
+        self.screen_d_latch_data: int = 0
+        self.screen_x: int = 0
+        self.screen_y: int = 0
+
+    def store(self, index: int, value: int) -> None:
+        if index == 0:  # Format: XXXXXX (6), X (5), Y (5)
+            self.screen_x = (value >> 5) & 0b11111
+            self.screen_y = value & 0b11111
+        elif index == 1:  # Draws the Pixel on store with any value
+            if self.screen_x == 0 or self.screen_y == 0:
+                raise ValueError(f'Screen Coordinates: [X: {self.screen_x}, Y: {self.screen_y}] not found. X, Y must be in range [1;31]')
+            row, column = SCREEN_SIZE - self.screen_y, SCREEN_SIZE - self.screen_x
+            if self.screen_d_latch_data:
+                self.buffer_rows[row] |= 1 << column
+            else:
+                self.buffer_rows[row] &= ~(1 << column)
+        elif index == 2:  # Format: XXXXXXXXXXXXXXX (15), Screen Data Value (1)
+            self.screen_d_latch_data = value & 0b1
+        elif index == 3:  # Sets all Pixels on store with any value
+            self.buffer_rows = [self.FULL_ROW if self.screen_d_latch_data else 0] * SCREEN_SIZE
+        elif index == 4:  # Pushes the Buffer on store with any value
+            self.rows = list(self.buffer_rows)
+            self.dirty = True
+
+    def state(self) -> tuple:
+        return tuple(self.rows), tuple(self.buffer_rows), self.screen_d_latch_data, self.screen_x, self.screen_y
+
+    def screen_data(self) -> list[list[int]]:
+        return [[(row >> column) & 1 for column in range(SCREEN_SIZE)] for row in self.rows]
+
+
+# Name, device class, store ports, load ports. The simulators access the devices by name (e.g. simulator.devices['screen'])
+DEVICES: list[tuple[str, type[IODevice], list[int], list[int]]] = [
+    ('controller', Controller, [], [0]),
+    ('random_number', RandomNumber, [], [1]),
+    ('letters', LetterDisplay, [0, 1], []),
+    ('number_display', NumberDisplay, [2], []),
+    ('screen', Screen, [3, 4, 5, 6, 7], [])
+]
+
+
+def create_bus(devices: dict[str, IODevice] | None = None) -> tuple[IOBus, dict[str, IODevice]]:
+    # devices: Instances to use instead of new ones, by name (e.g. a RandomNumber with a seeded rng)
+    devices = devices or {}
+    io_bus = IOBus()
+    registered = {name: io_bus.register(devices.get(name) or device_class(), store_ports, load_ports)
+                  for name, device_class, store_ports, load_ports in DEVICES}
+    return io_bus, registered
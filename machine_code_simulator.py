@@ -0,0 +1,335 @@
+import random
+import sys
+
+from colorama import Fore, Style
+
+import io_devices
+from assembly_to_schematic import assembler
+
+# Executes the machine code (32 Bit words, as generated by assembler.translate_instruction_to_machine_code) directly,
+# like the Minecraft CPU does: Every word gets decoded by extracting its bit fields, not by reading the assembly text.
+#
+# lockstep_check runs the machine code next to the assembly level simulator (app.Simulator) and reports the first
+# instruction after which their states differ. That catches encoder bugs (wrong field order, immediates that don't fit
+# their field, wrong jump targets, ...) before the schematic gets pasted into Minecraft.
+#
+# Check every program of the library with:
+#     python machine_code_simulator.py [max cycles per program]
+
+OPERATIONS: dict[int, str] = {int(opcode, 2): operation for operation, opcode in assembler.OPCODES.items()}
+
+# Operand fields (lowest bit, width) in the order of the assembly operands, bits 0 - 4 are always the opcode
+RA_FIELDS: list[tuple[int, int]] = [(5, 5), (10, 5), (15, 5)]  # Destination, Source 1, Source 2
+J_FIELDS: list[tuple[int, int]] = [(5, 11)]  # Target address
+INSTRUCTION_FIELDS: dict[str, list[tuple[int, int]]] = {'NOP': [],
+                                                        'ADD': RA_FIELDS,
+                                                        'SUB': RA_FIELDS,
+                                                        'XOR': RA_FIELDS,
+                                                        'OR': RA_FIELDS,
+                                                        'AND': RA_FIELDS,
+                                                        'RSH': [(5, 5), (10, 5)],  # Destination, Source
+                                                        'ADI': [(5, 5), (10, 5), (15, 16)],  # Destination, Source, Immediate
+                                                        'ST': [(10, 5), (15, 5), (20, 8)],  # Value, Address, Offset
+                                                        'LD': [(5, 5), (15, 5), (20, 8)],  # Destination, Address, Offset
+                                                        'PT-ST': [(10, 5), (15, 3)],  # Value, Port
+                                                        'PT-LD': [(5, 5), (18, 3)],  # Destination, Port
+                                                        'JMP': J_FIELDS,
+                                                        'CAL': J_FIELDS,
+                                                        'RET': [],
+                                                        'BEQ': J_FIELDS,
+                                                        'BNE': J_FIELDS,
+                                                        'BLT': J_FIELDS,
+                                                        'BGT': J_FIELDS,
+                                                        'HLT': []
+                                                        }
+
+WORD_BITS: int = 32
+CALL_STACK_DEPTH: int = 16
+
+REGISTER_WRITES: set[str] = {'ADD', 'SUB', 'XOR', 'OR', 'AND', 'RSH', 'ADI', 'LD', 'PT-LD'}
+BRANCH_FLAGS: dict[str, int] = {'BEQ': 0, 'BNE': 1, 'BLT': 2, 'BGT': 3}  # Index in MachineCodeSimulator.alu_flags
+
+
+def decode_word(word: str, address: int) -> tuple[str, int, int, int]:
+    if len(word) != WORD_BITS or word.strip('01'):
+        raise ValueError(f'{Fore.RED}Fatal Error. Word {address} ("{word}") is not a {WORD_BITS} Bit machine code word.{Style.RESET_ALL}')
+
+    value = int(word, 2)
+    operation = OPERATIONS.get(value & 0b11111)
+    if operation is None:
+        raise ValueError(f'{Fore.RED}Fatal Error. Word {address} ("{word}") has the unknown opcode {value & 0b11111}.{Style.RESET_ALL}')
+
+    fields = INSTRUCTION_FIELDS[operation]
+    used_bits = 0b11111
+    for shift, width in fields:
+        used_bits |= ((1 << width) - 1) << shift
+    if value & ~used_bits:
+        raise ValueError(f'{Fore.RED}Fatal Error. Word {address} ("{word}") sets bits outside of the {operation} fields.{Style.RESET_ALL}')
+
+    operands = [(value >> shift) & ((1 << width) - 1) for shift, width in fields] + [0, 0, 0]
+    return operation, operands[0], operands[1], operands[2]
+
+
+def decode_machine_code(machine_code: list[str]) -> list[tuple[str, int, int, int]]:
+    return [decode_word(word, address) for address, word in enumerate(machine_code)]
+
+
+def assemble(lines: list[str]) -> list[str]:
+    # Preprocessed assembly -> machine code, like assembler.generate_machine_code (without reading the file / printing)
+    return [assembler.translate_instruction_to_machine_code(line.upper()) for line in lines]
+
+
+class MachineCodeSimulator:
+    def __init__(self, machine_code: list[str], rng: random.Random | None = None):
+        self.program: list[tuple[str, int, int, int]] = decode_machine_code(machine_code)
+
+        self.registers: list[int] = [0] * 32
+        self.data_memory: list[int] = [0] * 256
+        self.alu_flags: list[bool] = [False] * 4  # BEQ, BNE, BLT, BGT
+        self.call_stack: list[int] = []
+        self.program_counter: int = 0
+        self.running: bool = True
+        self.halted: bool = False
+        self.cycles: int = 0
+        self.errors: list[str] = []
+
+        # Same devices as the Simulator in app.py
+        self.io_bus, self.devices = io_devices.create_bus({'random_number': io_devices.RandomNumber(rng)})
+
+    def fault(self, message: str) -> None:
+        self.running = False
+        self.errors.append(message)
+
+    def update_alu_flags(self, result: int) -> None:
+        # Minecraft Implementation (see Simulator.update_alu_flags)
+        beq = result == 0
+        blt = result >> 15 == 1
+        self.alu_flags = [beq, not beq, blt, not beq and not blt]
+
+    def step(self) -> bool:
+        if not self.running:
+            return False
+
+        if self.program_counter >= len(self.program):
+            self.fault('No halt at the end of the program')
+            return False
+
+        operation, a, b, c = self.program[self.program_counter]
+        registers = self.registers
+        next_address = self.program_counter + 1
+
+        if operation == 'NOP':
+            pass
+        elif operation == 'ADD':
+            registers[a] = (registers[b] + registers[c]) & 0xFFFF
+            self.update_alu_flags(registers[a])
+        elif operation == 'SUB':
+            registers[a] = (registers[b] - registers[c]) & 0xFFFF
+            self.update_alu_flags(registers[a])
+        elif operation == 'XOR':
+            registers[a] = registers[b] ^ registers[c]
+            self.update_alu_flags(registers[a])
+        elif operation == 'OR':
+            registers[a] = registers[b] | registers[c]
+            self.update_alu_flags(registers[a])
+        elif operation == 'AND':
+            registers[a] = registers[b] & registers[c]
+            self.update_alu_flags(registers[a])
+        elif operation == 'RSH':
+            registers[a] = registers[b] >> 1
+            self.update_alu_flags(registers[a])
+        elif operation == 'ADI':
+            registers[a] = (registers[b] + c) & 0xFFFF
+            self.update_alu_flags(registers[a])
+        elif operation in ('ST', 'LD'):
+            address = registers[b] + c
+            if address >= len(self.data_memory):
+                self.fault(f'Data memory address {address} out of range')
+                return False
+            if operation == 'ST':
+                self.data_memory[address] = registers[a]
+            else:
+                registers[a] = self.data_memory[address]
+        elif operation == 'PT-ST':
+            try:
+                self.io_bus.store(b, registers[a])
+            except ValueError as error:
+                self.errors.append(str(error))  # Like the Simulator: Shown, but the program keeps running
+        elif operation == 'PT-LD':
+            registers[a] = self.io_bus.load(b) & 0xFFFF
+        elif operation == 'JMP':
+            next_address = a
+        elif operation == 'CAL':
+            self.call_stack.append(self.program_counter + 1)
+            next_address = a
+        elif operation == 'RET':
+            if not self.call_stack:
+                self.fault('Return with an empty call stack')
+                return False
+            next_address = self.call_stack.pop()
+        elif operation in BRANCH_FLAGS:
+            if self.alu_flags[BRANCH_FLAGS[operation]]:
+                next_address = a
+        elif operation == 'HLT':
+            self.running = False
+            self.halted = True
+            next_address = self.program_counter
+
+        registers[0] = 0  # Make sure r0 is always 0
+        self.data_memory[0] = 0  # Make sure d0 is always 0
+
+        if len(self.call_stack) > CALL_STACK_DEPTH:
+            self.call_stack = self.call_stack[-CALL_STACK_DEPTH:]  # Max 16 Layers Deep
+
+        self.program_counter = next_address
+        self.cycles += 1
+        return True
+
+    def run(self, max_cycles: int) -> int:
+        for _ in range(max_cycles):
+            if not self.step():
+                break
+
+        return self.cycles
+
+
+def written_locations(operation: str, a: int, b: int, c: int, registers) -> tuple[set[int], set[int]]:
+    # Registers & data memory addresses an instruction writes (registers: the state after it, ST doesn't change them)
+    if operation in REGISTER_WRITES:
+        return {a}, set()
+    if operation == 'ST':
+        return set(), {registers[b] + c}
+    return set(), set()
+
+
+def compare_state(reference, engine: MachineCodeSimulator, parts: list[str],
+                  decoded: tuple[str, int, int, int]) -> tuple[str, object, object] | None:
+    # reference: app.Simulator. Only compares what the executed instruction can change (the rest got compared before),
+    # as written by the assembly and as written by the decoded machine code (e.g. a register field in the wrong place)
+    if parts[0] != decoded[0]:
+        return 'operation', parts[0], decoded[0]
+
+    operands = [int(part[1:]) if part[0] in 'RP' else int(part) for part in parts[1:]] + [0, 0, 0]
+    reference_registers = {operands[1]: int(reference.REGISTERS[parts[2]], 2)} if parts[0] == 'ST' else None  # ST: Address register
+    registers, addresses = written_locations(parts[0], operands[0], operands[1], operands[2], reference_registers)
+    engine_registers, engine_addresses = written_locations(*decoded, engine.registers)
+    registers |= engine_registers
+    addresses = {address for address in addresses | engine_addresses if address < len(engine.data_memory)}
+
+    comparisons = [('pc', reference.bin_to_int(reference.program_counter), engine.program_counter),
+                   ('registers', {register: int(reference.REGISTERS[f'R{register}'], 2) for register in registers},
+                    {register: engine.registers[register] for register in registers}),
+                   ('alu_flags', list(reference.ALU_FLAGS.values()), engine.alu_flags)]
+
+    if addresses:
+        comparisons.append(('data_memory', {address: int(reference.DATA_MEMORY_ADDRESSES[f'D{address}'], 2) for address in addresses},
+                            {address: engine.data_memory[address] for address in addresses}))
+    if parts[0] in ('CAL', 'RET'):
+        comparisons.append(('call_stack', [int(value, 2) for value in reference.call_stack], engine.call_stack))
+    elif parts[0] in ('PT-ST', 'PT-LD'):
+        comparisons.append(('ports', reference.io_bus.written, engine.io_bus.written))
+        comparisons += [(name, device.state(), engine.devices[name].state()) for name, device in reference.devices.items()]
+
+    for name, expected, actual in comparisons:
+        if expected != actual:
+            if isinstance(expected, dict):  # Only the differing entries
+                expected, actual = ({key: value for key, value in values.items() if expected[key] != actual[key]}
+                                    for values in (expected, actual))
+            return name, expected, actual
+    return None
+
+
+def lockstep_check(machine_code: list[str], create_reference, instructions: list[list[str]], max_cycles: int,
+                   seed: int = 0) -> dict:
+    # machine_code: The words that go into the schematic
+    # create_reference: rng -> a new app.Simulator using it, instructions: The program it executes (see CompiledProgram.instructions)
+    # Both get the same random numbers (from seed), the controller stays unpressed.
+    report = {'instructions': len(machine_code), 'cycles': 0, 'halted': False, 'divergence': None, 'errors': []}
+
+    try:
+        engine = MachineCodeSimulator(machine_code, random.Random(seed))
+    except ValueError as error:
+        report['divergence'] = {'cycle': 0, 'field': 'decode', 'message': str(error)}
+        return report
+
+    reference = create_reference(random.Random(seed))
+    reference.display_error_message = report['errors'].append
+    reference.simulation_running = True
+
+    if len(instructions) != len(engine.program):
+        report['divergence'] = {'cycle': 0, 'field': 'length', 'assembly': len(instructions), 'machine_code': len(engine.program)}
+        return report
+
+    for cycle in range(max_cycles):
+        address = engine.program_counter
+        if address >= len(instructions):
+            report['errors'].append('No halt at the end of the program')
+            break
+
+        try:
+            reference.execute_instruction(instructions[address])
+        except (KeyError, IndexError) as error:  # e.g. RET with an empty call stack
+            report['errors'].append(f'Simulator: {error!r}')
+            break
+        engine.step()
+
+        difference = compare_state(reference, engine, instructions[address], engine.program[address])
+        if difference is not None:
+            field, expected, actual = difference
+            report['divergence'] = {'cycle': cycle + 1, 'address': address, 'instruction': ' '.join(instructions[address]),
+                                    'word': machine_code[address], 'field': field, 'assembly': expected, 'machine_code': actual}
+            break
+
+        if not engine.running:
+            break
+
+    report['cycles'] = engine.cycles
+    report['halted'] = engine.halted
+    report['errors'] += engine.errors
+    return report
+
+
+def format_divergence(divergence: dict) -> str:
+    if 'message' in divergence:
+        return divergence['message']
+    if divergence['field'] == 'length':
+        return (f'Fatal Error. The machine code has {divergence["machine_code"]} instructions, '
+                f'the assembly {divergence["assembly"]}.')
+    return (f'Fatal Error. Machine code differs from the assembly after cycle {divergence["cycle"]}: '
+            f'Word {divergence["address"]} ({divergence["instruction"]} -> {divergence["word"]}), '
+            f'{divergence["field"]}: {divergence["assembly"]} (assembly) != {divergence["machine_code"]} (machine code)')
+
+
+def check_library(max_cycles: int) -> bool:
+    import app  # Only here, app.py imports this module
+
+    passed = True
+    for program in app.library.list_programs():
+        path = app.library.path(program['directory'], program['name'])
+        source = app.library.read(program['directory'], program['name'])
+
+        try:
+            lines = assembler.preprocess_assembly(path)
+            if app.OPTIMIZE_ASSEMBLY:
+                lines, _ = assembler.optimize_assembly(lines)
+            machine_code = assemble(lines)
+        except (ValueError, IndexError, KeyError) as error:
+            print(f'{Fore.RED}{path}: Could not assemble ({error}){Style.RESET_ALL}')
+            passed = False
+            continue
+
+        instructions = [line.upper().split() for line in app.Simulator(1).preprocess_source(source)]
+        report = lockstep_check(machine_code, lambda rng: app.Simulator(1, rng), instructions, max_cycles)
+
+        if report['divergence'] is not None:
+            print(f'{Fore.RED}{path}: {format_divergence(report["divergence"])}{Style.RESET_ALL}')
+            passed = False
+        else:
+            state = 'halted' if report['halted'] else 'stopped' if report['errors'] else 'still running'
+            print(f'{Fore.LIGHTGREEN_EX}{path}: {report["cycles"]} cycles identical ({state}){Style.RESET_ALL}')
+
+    return passed
+
+
+if __name__ == '__main__':
+    sys.exit(0 if check_library(int(sys.argv[1]) if len(sys.argv) > 1 else 100000) else 1)
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Program library: The .txt programs in programs/ and example_programs/ (listing, loading, saving)
+# Compiled programs (preprocessed & decoded) are kept in an LRU cache, keyed by a hash of their source,
+# so switching between / reloading programs does not preprocess them again.
+
+PROGRAM_DIRECTORIES: list[str] = ['programs', 'example_programs']
+SAVE_DIRECTORY: str = 'programs'
+
+MAX_CACHED_PROGRAMS: int = 32
+MAX_CACHED_BYTES: int = 16 * 1024 * 1024
+
+
+class CompiledProgram:
+    def __init__(self, key: str, lines: list[str]):
+        self.key: str = key
+        self.lines: list[str] = lines  # Preprocessed (labels, definitions & characters resolved), as shown in the UI
+        self.instructions: list[list[str]] = [line.upper().split() for line in lines]  # Decoded, ready to execute
+        self.size: int = (sum(sys.getsizeof(line) for line in lines) +
+                          sum(sys.getsizeof(parts) + sum(sys.getsizeof(part) for part in parts) for parts in self.instructions))
+
+
+class ProgramCache:
+    # Used by the Flask request threads and the simulation thread (Simulator.load_program), get / put hold the lock
+    def __init__(self, max_programs: int = MAX_CACHED_PROGRAMS, max_bytes: int = MAX_CACHED_BYTES):
+        self.max_programs: int = max_programs
+        self.max_bytes: int = max_bytes
+        self.programs: OrderedDict[str, CompiledProgram] = OrderedDict()  # Least recently used first
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def get(self, key: str) -> CompiledProgram | None:
+        with self.lock:
+            program = self.programs.get(key)
+            if program is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.programs.move_to_end(key)
+            return program
+
+    def put(self, program: CompiledProgram) -> None:
+        with self.lock:
+            if program.key in self.programs:
+                self.bytes -= self.programs.pop(program.key).size
+            self.programs[program.key] = program
+            self.bytes += program.size
+
+            while len(self.programs) > 1 and (len(self.programs) > self.max_programs or self.bytes > self.max_bytes):
+                _, evicted = self.programs.popitem(last=False)
+                self.bytes -= evicted.size
+
+
+def source_key(source: str, variant: str = '') -> str:
+    # variant: Anything else the compiled program depends on (e.g. whether it got optimized)
+    return f'{hashlib.sha256(source.encode("utf-8")).hexdigest()}:{variant}'
+
+
+class ProgramLibrary:
+    def __init__(self, directories: list[str] = PROGRAM_DIRECTORIES, save_directory: str = SAVE_DIRECTORY,
+                 cache: ProgramCache | None = None):
+        self.directories: list[str] = directories
+        self.save_directory: str = save_directory
+        self.cache: ProgramCache = cache if cache is not None else ProgramCache()
+
+    def path(self, directory: str, name: str) -> str:
+        name = os.path.basename(name)  # No paths outside of the library
+        if directory not in self.directories or not name.endswith('.txt'):
+            raise ValueError(f'Program "{directory}/{name}" is not part of the library')
+        return os.path.join(directory, name)
+
+    def list_programs(self) -> list[dict[str, str]]:
+        programs = []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.txt'):
+                    programs.append({'name': name, 'directory': directory})
+        return programs
+
+    def read(self, directory: str, name: str) -> str:
+        with open(self.path(directory, name), 'r') as file:
+            return file.read()
+
+    def save(self, name: str, source: str) -> None:
+        with open(self.path(self.save_directory, name), 'w') as file:
+            file.write(source)
+
+    def compile(self, source: str, preprocess, variant: str = '') -> CompiledProgram:
+        # preprocess: source (str) -> preprocessed lines, only called if the program is not cached yet
+        key = source_key(source, variant)
+        program = self.cache.get(key)
+
+        if program is None:
+            program = CompiledProgram(key, preprocess(source))
+            if program.lines:  # Failed / empty programs are not cached, so their error shows up again
+                self.cache.put(program)
+
+        return program
@@ -0,0 +1,111 @@
+import time
+
+# Runtime metrics of the simulator, exposed at /metrics (Prometheus text format) and as the 'simulation_stats' Socket.IO event
+#
+# The run loop only adds to plain attributes (no locks, no method calls), everything else is computed when the metrics are read.
+
+STATS_INTERVAL: float = 1.0  # Seconds between 'simulation_stats' events (and achieved / target rate updates) while running
+LAG_THRESHOLD: float = 0.001  # Catching up less than this is scheduling jitter, not lag
+
+
+class RuntimeMetrics:
+    def __init__(self):
+        self.instructions: int = 0
+        self.scheduled_seconds: float = 0.0  # Sum of the intervals the loop aimed for (1 / speed or hardware timing)
+        self.lag_events: int = 0  # The loop fell behind and reset its schedule (catch up)
+        self.lag_seconds: float = 0.0
+        self.execute_seconds: float = 0.0
+        self.emit_seconds: float = 0.0
+        self.sleep_seconds: float = 0.0
+        self.idle_seconds: float = 0.0  # Suspended in an idle loop (see Simulator.fast_forward_idle_loop)
+        self.skipped_instructions: int = 0  # Instructions of idle loops that were accounted for, but not executed
+        # Single simulation_update messages (one per client and update), per format (see wire_format.py)
+        self.messages: dict[str, int] = {'binary': 0, 'json': 0}
+        self.encode_seconds: dict[str, float] = {'binary': 0.0, 'json': 0.0}  # Building + serializing the message
+        self.send_seconds: dict[str, float] = {'binary': 0.0, 'json': 0.0}  # socketio.emit (JSON gets serialized again there)
+        self.binary_message_bytes: int = 0
+        self.json_message_bytes: int = 0
+        self.simulation_threads: int = 0
+
+        self.achieved_instructions_per_second: float = 0.0
+        self.target_instructions_per_second: float = 0.0
+        self.window_start: float = time.perf_counter()
+        self.window_instructions: int = 0
+        self.window_scheduled_seconds: float = 0.0
+
+    def update_rates(self, now: float) -> None:
+        elapsed = now - self.window_start
+        if elapsed <= 0:
+            return
+
+        instructions = self.instructions - self.window_instructions
+        scheduled_seconds = self.scheduled_seconds - self.window_scheduled_seconds
+        self.achieved_instructions_per_second = instructions / elapsed
+        self.target_instructions_per_second = instructions / scheduled_seconds if scheduled_seconds > 0 else 0.0
+
+        self.window_start = now
+        self.window_instructions = self.instructions
+        self.window_scheduled_seconds = self.scheduled_seconds
+
+    def restart_window(self, now: float) -> None:
+        # When the simulation starts / stops, so the rates don't include the time it was stopped
+        self.achieved_instructions_per_second = 0.0
+        self.target_instructions_per_second = 0.0
+        self.window_start = now
+        self.window_instructions = self.instructions
+        self.window_scheduled_seconds = self.scheduled_seconds
+
+    def summary(self, sessions: int, threads: int) -> dict[str, float]:
+        return {
+            'target_instructions_per_second': round(self.target_instructions_per_second, 1),
+            'achieved_instructions_per_second': round(self.achieved_instructions_per_second, 1),
+            'instructions': self.instructions,
+            'lag_events': self.lag_events,
+            'lag_seconds': round(self.lag_seconds, 3),
+            'execute_seconds': round(self.execute_seconds, 3),
+            'emit_seconds': round(self.emit_seconds, 3),
+            'sleep_seconds': round(self.sleep_seconds, 3),
+            'idle_seconds': round(self.idle_seconds, 3),
+            'skipped_instructions': self.skipped_instructions,
+            'messages': dict(self.messages),
+            'average_encode_microseconds': {wire_format: round(1e6 * self.encode_seconds[wire_format] / max(1, messages), 1)
+                                            for wire_format, messages in self.messages.items()},
+            'average_send_microseconds': {wire_format: round(1e6 * self.send_seconds[wire_format] / max(1, messages), 1)
+                                          for wire_format, messages in self.messages.items()},
+            'average_message_bytes': {'binary': round(self.binary_message_bytes / max(1, self.messages['binary']), 1),
+                                      'json': round(self.json_message_bytes / max(1, self.messages['json']), 1)},
+            'sessions': sessions,
+            'threads': threads,
+            'simulation_threads': self.simulation_threads
+        }
+
+    def to_prometheus(self, sessions: int, threads: int) -> str:
+        metrics = [
+            ('frostbyte_target_instructions_per_second', 'gauge', 'Requested instructions per second (last interval)', [('', self.target_instructions_per_second)]),
+            ('frostbyte_achieved_instructions_per_second', 'gauge', 'Executed instructions per second (last interval)', [('', self.achieved_instructions_per_second)]),
+            ('frostbyte_instructions_total', 'counter', 'Executed instructions while running (including skipped ones)', [('', self.instructions)]),
+            ('frostbyte_skipped_instructions_total', 'counter', 'Instructions of idle loops that were fast-forwarded', [('', self.skipped_instructions)]),
+            ('frostbyte_lag_events_total', 'counter', 'Times the run loop fell behind its schedule and caught up', [('', self.lag_events)]),
+            ('frostbyte_lag_seconds_total', 'counter', 'Time the run loop was behind its schedule', [('', self.lag_seconds)]),
+            ('frostbyte_loop_seconds_total', 'counter', 'Time spent in the run loop per phase',
+             [('{phase="execute"}', self.execute_seconds), ('{phase="emit"}', self.emit_seconds), ('{phase="sleep"}', self.sleep_seconds),
+              ('{phase="idle"}', self.idle_seconds)]),
+            ('frostbyte_messages_total', 'counter', 'Sent simulation_update messages',
+             [(f'{{format="{wire_format}"}}', messages) for wire_format, messages in self.messages.items()]),
+            ('frostbyte_message_encode_seconds_total', 'counter', 'Time spent building and serializing simulation_update messages',
+             [(f'{{format="{wire_format}"}}', seconds) for wire_format, seconds in self.encode_seconds.items()]),
+            ('frostbyte_message_send_seconds_total', 'counter', 'Time spent in socketio.emit for simulation_update messages',
+             [(f'{{format="{wire_format}"}}', seconds) for wire_format, seconds in self.send_seconds.items()]),
+            ('frostbyte_binary_message_bytes_total', 'counter', 'Payload bytes of binary simulation_update messages', [('', self.binary_message_bytes)]),
+            ('frostbyte_json_message_bytes_total', 'counter', 'Serialized bytes of JSON simulation_update messages', [('', self.json_message_bytes)]),
+            ('frostbyte_sessions', 'gauge', 'Connected Socket.IO sessions', [('', sessions)]),
+            ('frostbyte_threads', 'gauge', 'Active Python threads', [('', threads)]),
+            ('frostbyte_simulation_threads', 'gauge', 'Running simulation loops', [('', self.simulation_threads)])
+        ]
+
+        lines = []
+        for name, metric_type, description, samples in metrics:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines += [f'{name}{labels} {value}' for labels, value in samples]
+        return '\n'.join(lines) + '\n'
@@ -5,10 +5,84 @@ let lastUpdateTime = 0;
 let latestData = null;
 let updateScheduled = false;
 
+// Updates are sent in a binary format (see wire_format.py)
+// For debugging, run localStorage.setItem('jsonUpdates', 'true') and reload to receive JSON instead
+const JSON_UPDATES = localStorage.getItem('jsonUpdates') === 'true';
+const ALU_FLAG_BITS = ['BEQ', 'BNE', 'BLT', 'BGT'];
+const SCREEN_SIZE = 31;
+
+const pad = (value, digits) => String(value).padStart(digits, '0');
+
+function decodeUpdate(buffer) {
+    const words = new Uint16Array(buffer, 0, Math.floor(buffer.byteLength / 2));
+    const mask = words[1];
+    const data = { pc: pad(words[2], 4), int_pc: words[2], simulation_running: (words[3] & 1) === 1 };
+    let index = 4;
+
+    const readValues = (count, name) => {
+        const values = {};
+        for (let i = 0; i < count; i++) values[name(i)] = pad(words[index + i], 5);
+        index += count;
+        return values;
+    };
+
+    if (mask & 1) data.registers = readValues(32, i => `R${pad(i, 2)}`);
+    if (mask & 2) data.ps = readValues(8, i => `P${i}`);
+    if (mask & 4) data.pd = readValues(8, i => `P${i}`);
+    if (mask & 8) {
+        const firstAddress = words[index];
+        const count = words[index + 1];
+        index += 2;
+        data.data_memory = readValues(count, i => `D${pad(firstAddress + i, 3)}`);
+    }
+    if (mask & 16) {
+        const depth = words[index++];
+        data.call_stack = {};
+        for (let i = 0; i < 16; i++) data.call_stack[pad(i, 2)] = i < depth ? pad(words[index + i], 4) : '0000';
+        index += depth;
+    }
+    if (mask & 32) {
+        const flags = words[index++];
+        data.alu_flags = {};
+        ALU_FLAG_BITS.forEach((flag, bit) => data.alu_flags[flag] = (flags >> bit) & 1 ? 'True' : 'False');
+    }
+
+    const bytes = new Uint8Array(buffer, index * 2);
+    data.screen_data = [];
+    for (let y = 0; y < SCREEN_SIZE; y++) {
+        const row = [];
+        for (let x = 0; x < SCREEN_SIZE; x++) {
+            const bit = y * SCREEN_SIZE + x;
+            row.push((bytes[bit >> 3] >> (bit & 7)) & 1);
+        }
+        data.screen_data.push(row);
+    }
+
+    let offset = Math.ceil(SCREEN_SIZE * SCREEN_SIZE / 8);
+    const readString = () => {
+        const length = bytes[offset];
+        const text = String.fromCharCode(...bytes.subarray(offset + 1, offset + 1 + length));
+        offset += 1 + length;
+        return text;
+    };
+    data.letters = readString();
+    data.number = readString();
+    data.big_number = readString();
+    data.in_game_time = readString();
+
+    return data;
+}
+
 socket.on('simulation_update', (data) => {
     // console.log("data received", data);
 
-    latestData = data;
+    if (data.binary) {
+        const listing = data.preprocessed_assembly;
+        data = decodeUpdate(data.binary);
+        if (listing) data.preprocessed_assembly = listing;
+    }
+
+    latestData = {...latestData, ...data}; // Panels missing in this update keep their last value
 
     const now = Date.now()
     const timeSinceLast = now - lastUpdateTime;
@@ -17,12 +91,14 @@ socket.on('simulation_update', (data) => {
         performUIUpdate(latestData);
         lastUpdateTime = now;
         updateScheduled = false;
+        delete latestData.preprocessed_assembly; // Only rebuild the listing once
     } else if (!updateScheduled) {
         updateScheduled = true;
         setTimeout(() => {
             performUIUpdate(latestData);
             lastUpdateTime = Date.now();
             updateScheduled = false;
+            delete latestData.preprocessed_assembly; // Only rebuild the listing once
         }, MIN_INTERVAL - timeSinceLast);
     }
 });
@@ -34,38 +110,40 @@ function performUIUpdate(data) {
     // Update Program Counter
     document.getElementById('pc-value').textContent = data.pc;
 
+    // Panels are only sent if subscribed to (see sendSubscription)
+
     // Update Registers
-    document.querySelectorAll('.register-value').forEach(span => {
+    if (data.registers) document.querySelectorAll('.register-value').forEach(span => {
         const name = span.dataset.reg;
         if (data.registers[name]) span.textContent = data.registers[name];
     });
 
     // Update Read-Only Ports (ps)
-    document.querySelectorAll('.port-ps-value').forEach(span => {
+    if (data.ps) document.querySelectorAll('.port-ps-value').forEach(span => {
         const name = span.dataset.ps;
         if (data.ps[name]) span.textContent = data.ps[name];
     });
 
     // Update Write-Only Ports (pd)
-    document.querySelectorAll('.port-pd-value').forEach(span => {
+    if (data.pd) document.querySelectorAll('.port-pd-value').forEach(span => {
         const name = span.dataset.pd;
         if (data.pd[name]) span.textContent = data.pd[name];
     });
 
     // Update Data Memory
-    document.querySelectorAll('.data-memory-value').forEach(span => {
+    if (data.data_memory) document.querySelectorAll('.data-memory-value').forEach(span => {
         const name = span.dataset.mem;
         if (data.data_memory[name]) span.textContent = data.data_memory[name];
     });
 
     // Update Call Stack
-    document.querySelectorAll('.callstack-value').forEach(span => {
+    if (data.call_stack) document.querySelectorAll('.callstack-value').forEach(span => {
         const name = span.dataset.call;
         if (data.call_stack[name]) span.textContent = data.call_stack[name];
     });
 
     // Update ALU Flags
-    document.querySelectorAll('.alu-flag-value').forEach(span => {
+    if (data.alu_flags) document.querySelectorAll('.alu-flag-value').forEach(span => {
         const name = span.dataset.flag;
         span.textContent = data.alu_flags[name];
     });
@@ -74,6 +152,7 @@ function performUIUpdate(data) {
     document.getElementById('letters-value').textContent = data.letters;
     document.getElementById('number-value').textContent = data.number;
     document.getElementById('big-number-value').textContent = data.big_number;
+    document.getElementById('in-game-time-value').textContent = data.in_game_time;
 
     // Update Screen Data
     const flatPixels = data.screen_data.flat();
@@ -131,6 +210,35 @@ socket.on('generate_schematic_successful', data => {
         }, 750);
 })
 
+socket.on('timing_report', (data) => {
+    const formatReport = (title, report) => [
+        `${title}: ${report.time} (${report.ticks} redstone ticks, ${report.instructions} instructions)`,
+        ...report.regions.map(region =>
+            `  ${String(region.start).padStart(4, '0')}-${String(region.end).padStart(4, '0')}: ${region.time} (${region.ticks} ticks) ${region.first_instruction}`)
+    ].join('\n');
+
+    document.getElementById('timing-report').textContent = [
+        formatReport('Simulated', data.simulated),
+        formatReport('Static (one pass)', data.static)
+    ].join('\n\n');
+});
+
+// Sent every second while running (full stats also at /metrics), call requestStats() in the browser console for all of them
+let statsRequested = false;
+function requestStats() {
+    statsRequested = true;
+    socket.emit('request_stats');
+}
+
+socket.on('simulation_stats', (stats) => {
+    document.getElementById('achieved-speed-value').textContent =
+        `${Math.round(stats.achieved_instructions_per_second)} / ${Math.round(stats.target_instructions_per_second)} Hz`;
+    if (statsRequested) {
+        console.table(stats);
+        statsRequested = false;
+    }
+});
+
 socket.on('update_code', (data) => {
     document.getElementById("codeInput").value = data.content;
 });
@@ -157,8 +265,60 @@ document.getElementById('gen-schem-btn').addEventListener('click', () => {
     socket.emit('generate_schematic');
 });
 
+document.getElementById('timing-report-btn').addEventListener('click', () => {
+    socket.emit('request_timing_report');
+});
+
+// Subscriptions: The server only sends the panels that are currently visible (and the selected memory pages)
+const MEMORY_PAGE_SIZE = 16;
+const memoryPageStart = document.getElementById('memory-page-start');
+const memoryPageEnd = document.getElementById('memory-page-end');
+
+function selectedMemoryPages() {
+    const last = parseInt(memoryPageEnd.max);
+    const start = Math.max(0, Math.min(last, parseInt(memoryPageStart.value) || 0));
+    const end = Math.max(start, Math.min(last, parseInt(memoryPageEnd.value) || 0));
+    return [start, end];
+}
+
+// Create the Data Memory cells of the selected pages
+function renderMemoryPages() {
+    const [start, end] = selectedMemoryPages();
+    const container = document.getElementById('data-memory');
+    container.querySelectorAll('.memory-cell').forEach(cell => cell.remove());
+
+    for (let address = start * MEMORY_PAGE_SIZE; address < (end + 1) * MEMORY_PAGE_SIZE; address++) {
+        const name = `D${String(address).padStart(3, '0')}`;
+        const cell = document.createElement('div');
+        cell.className = 'memory-cell';
+        cell.innerHTML = `<span class="label">${name}</span>: <span class="value data-memory-value" data-mem="${name}">00000</span>`;
+        container.appendChild(cell);
+    }
+}
+
+function sendSubscription() {
+    const panels = ['preprocessed_assembly']; // The code viewer is always visible
+    document.querySelectorAll('.sub-collapsible[data-panel]').forEach(btn => {
+        if (btn.classList.contains('active') && btn.offsetParent !== null) panels.push(btn.dataset.panel);
+    });
+
+    socket.emit('subscribe', { panels: panels, memory_pages: selectedMemoryPages(), binary: !JSON_UPDATES });
+}
+
+[memoryPageStart, memoryPageEnd].forEach(input => input.addEventListener('change', () => {
+    renderMemoryPages();
+    sendSubscription();
+}));
+
+// (Re-)Subscribe on every connect, the server sends an update afterwards
+socket.on('connect', () => {
+    delete latestData?.preprocessed_assembly;
+    sendSubscription();
+});
+
 // On website Load, Request an Update
 document.addEventListener('DOMContentLoaded', () => {
+    renderMemoryPages();
     socket.emit('request_update');
 });
 
@@ -207,6 +367,7 @@ function setupToggle(buttonClass, contentClass) {
                 content.style.display = "none";
             }
             saveCollapseState(buttonClass);
+            sendSubscription();
         });
     });
 }
@@ -251,7 +412,7 @@ function updateSpeed(value) {
     speedOutput.textContent = clampedValue;
     localStorage.setItem(SPEED_STORAGE_KEY, clampedValue); // Save the value
 
-    socket.emit("update_speed", { speed: clampedValue });
+    socket.emit("update_speed", { speed: clampedValue, hardware: hardwareSpeedCheckbox.checked });
 }
 
 // Function to restore speed from localStorage
@@ -281,6 +442,16 @@ autoScrollCheckbox.addEventListener('change', () => {
     localStorage.setItem(AUTO_SCROLL_KEY, enabled.toString());
 });
 
+// Hardware Speed: Run as fast as the Minecraft CPU would (ignores the Instructions / Second)
+const HARDWARE_SPEED_KEY = 'hardwareSpeedEnabled';
+const hardwareSpeedCheckbox = document.getElementById('hardware-speed-toggle');
+hardwareSpeedCheckbox.checked = localStorage.getItem(HARDWARE_SPEED_KEY) === 'true'; // Restore before the speed gets sent
+
+hardwareSpeedCheckbox.addEventListener('change', () => {
+    localStorage.setItem(HARDWARE_SPEED_KEY, hardwareSpeedCheckbox.checked.toString());
+    updateSpeed(parseInt(speedSlider.value));
+});
+
 // Controller Input Handling
 const keysPressed = new Set();
 
@@ -396,6 +567,53 @@ dropArea.addEventListener("drop", e => {
     });
 });
 
+// Program Library (programs/ & example_programs/)
+const programSelect = document.getElementById('program-select');
+
+function refreshProgramList() {
+    fetch('/programs')
+        .then(response => response.json())
+        .then(data => {
+            programSelect.innerHTML = '';
+            data.programs.forEach(program => {
+                const option = document.createElement('option');
+                option.value = JSON.stringify(program);
+                option.textContent = `${program.directory}/${program.name}`;
+                programSelect.appendChild(option);
+            });
+        });
+}
+
+document.addEventListener('DOMContentLoaded', refreshProgramList);
+
+document.getElementById('program-load-btn').addEventListener('click', () => {
+    if (!programSelect.value) return;
+
+    fetch('/programs/load', {
+        method: 'POST',
+        body: new URLSearchParams(JSON.parse(programSelect.value)),
+    }).then(response => {
+        if (response.ok) location.reload(); // Reload to show updated code
+    });
+});
+
+document.getElementById('program-save-btn').addEventListener('click', () => {
+    let name = document.getElementById('program-name').value.trim();
+    if (!name) return;
+    if (!name.endsWith('.txt')) name += '.txt';
+
+    fetch('/programs/save', {
+        method: 'POST',
+        body: new URLSearchParams({ name: name, codeInput: document.getElementById('codeInput').value }),
+    }).then(response => {
+        document.getElementById('save-status').textContent = response.ok ? `Saved as programs/${name}!` : 'Saving failed.';
+        setTimeout(() => {
+            document.getElementById('save-status').textContent = '';
+        }, 750);
+        refreshProgramList();
+    });
+});
+
 function saveText() {
     const text = document.getElementById('codeInput').value;
     fetch('/save', {
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are in the repository root (no package), add it so the tests also run with a plain `pytest`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+import pytest
+
+import app
+import batch_simulator
+
+# Programs without random numbers (the batch simulator draws its own), so every lane has to end in the Simulator's state
+EXAMPLES = ['fibonacci', 'hello_world', 'line_drawing', 'pong']
+MAX_CYCLES = 200000
+
+
+def run_simulator(lines: list[str]) -> tuple[app.Simulator, int]:
+    simulator = app.Simulator(1)
+    simulator.simulation_running = True
+    simulator.errors = []
+    simulator.display_error_message = simulator.errors.append
+    instructions = [line.upper().split() for line in lines]
+
+    cycles = 0
+    while simulator.simulation_running and cycles < MAX_CYCLES:
+        simulator.execute_instruction(instructions[simulator.bin_to_int(simulator.program_counter)])
+        cycles += 1
+    return simulator, cycles
+
+
+def run_batch(lines: list[str], lanes: int = 4) -> batch_simulator.BatchSimulator:
+    batch = batch_simulator.BatchSimulator(lines, lanes)
+    batch.run(MAX_CYCLES)
+    return batch
+
+
+def assert_same_state(simulator: app.Simulator, cycles: int, state: dict) -> None:
+    assert state['error'] is None and simulator.errors == []
+    assert state['halt_cycle'] == cycles
+    assert state['registers'] == [simulator.bin_to_int(value) for value in simulator.REGISTERS.values()]
+    assert state['data_memory'] == [simulator.bin_to_int(simulator.DATA_MEMORY_ADDRESSES[f'D{address}']) for address in range(256)]
+    assert state['screen_data'] == simulator.screen.screen_data()
+    assert state['letters'] == simulator.letters.text()
+    assert (state['number'], state['big_number']) == (simulator.number_display.number, simulator.number_display.big_number)
+
+
+@pytest.mark.parametrize('name', EXAMPLES)
+def test_examples_match_simulator(name):
+    lines = app.Simulator(1).preprocess_source(app.library.read('example_programs', f'{name}.txt'))
+    simulator, cycles = run_simulator(lines)
+    batch = run_batch(lines)
+
+    for lane in range(batch.lanes):
+        assert_same_state(simulator, cycles, batch.lane_state(lane))
+
+
+def test_letters_written_after_update_without_clear_are_shown():
+    lines = app.Simulator(1).preprocess_source('adi r2 r0 1\nadi r1 r0 "A"\npt-st r1 p1\npt-st r2 p0\npt-st r1 p1\nhlt')
+    simulator, cycles = run_simulator(lines)
+    state = run_batch(lines).lane_state(0)
+
+    assert state['letters'] == simulator.letters.text() == 'AA_________'
+    assert_same_state(simulator, cycles, state)
+
+
+@pytest.mark.parametrize('source', ['adi r1 r0 5\nst r1 r0 -1\nhlt', 'ld r1 r0 -3\nhlt', 'adi r2 r0 255\nst r1 r2 1\nhlt',
+                                    'adi r2 r0 200\nld r1 r2 100\nhlt'])
+def test_data_memory_address_out_of_range_faults(source):
+    lines = app.Simulator(1).preprocess_source(source)
+    simulator, cycles = run_simulator(lines)
+    state = run_batch(lines).lane_state(0)
+
+    assert simulator.errors[0].startswith('Data memory address') and state['error'] == 'Data memory address out of range'
+    assert not state['halted']
+    assert state['cycles'] == cycles - 1 == len(lines) - 2  # The faulting instruction doesn't count
+    assert state['data_memory'] == [0] * 256 and len(simulator.DATA_MEMORY_ADDRESSES) == 256
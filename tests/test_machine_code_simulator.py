@@ -0,0 +1,54 @@
+import pytest
+
+import app
+import machine_code_simulator
+from assembly_to_schematic import assembler
+
+
+def lockstep(lines: list[str], machine_code: list[str] | None = None, max_cycles: int = 1000) -> dict:
+    machine_code = machine_code if machine_code is not None else machine_code_simulator.assemble(lines)
+    return machine_code_simulator.lockstep_check(machine_code, lambda rng: app.Simulator(1, rng), [line.upper().split() for line in lines],
+                                                 max_cycles)
+
+
+def test_library_matches_simulator():
+    assert machine_code_simulator.check_library(20000)
+
+
+def test_every_instruction_type_matches_simulator():
+    report = lockstep(['adi r1 r0 300', 'adi r2 r0 7', 'sub r3 r1 r2', 'xor r4 r3 r1', 'or r5 r4 r2', 'and r6 r5 r1', 'rsh r7 r6',
+                       'st r1 r2 200', 'ld r8 r2 200', 'pt-st r2 p2', 'cal 13', 'beq 0', 'hlt', 'add r9 r8 r1', 'ret'])
+
+    assert report['divergence'] is None
+    assert report['halted'] and report['cycles'] == 15
+
+
+def swap_fields(instruction: str, operation: str, first: slice, second: slice) -> str:
+    word = assembler.translate_instruction_to_machine_code(instruction)
+    if not instruction.startswith(operation + ' '):
+        return word
+    bits = list(word)
+    bits[first], bits[second] = bits[second], bits[first]
+    return ''.join(bits)
+
+
+@pytest.mark.parametrize('lines, operation, first, second, field', [
+    (['adi r1 r0 7', 'adi r2 r0 3', 'sub r3 r1 r2', 'hlt'], 'SUB', slice(12, 17), slice(17, 22), 'registers'),  # Sources swapped
+    (['adi r1 r0 7', 'hlt'], 'ADI', slice(17, 22), slice(22, 27), 'registers'),  # Destination in the source field
+    (['adi r1 r0 5', 'adi r2 r0 9', 'st r2 r1 3', 'hlt'], 'ST', slice(4, 12), slice(12, 20), 'data_memory')  # Offset in the register fields
+])
+def test_misplaced_fields_are_found(lines, operation, first, second, field):
+    machine_code = [swap_fields(line.upper(), operation, first, second) for line in lines]
+    divergence = lockstep(lines, machine_code)['divergence']
+
+    assert divergence is not None
+    assert divergence['field'] == field
+    assert divergence['instruction'].split()[0] == operation
+
+
+def test_invalid_words_are_reported():
+    machine_code = machine_code_simulator.assemble(['adi r1 r0 7', 'hlt'])
+    machine_code[0] = '1' + machine_code[0][1:]  # Bit outside of the ADI fields
+
+    assert lockstep(['adi r1 r0 7', 'hlt'], machine_code)['divergence']['field'] == 'decode'
+    assert lockstep(['adi r1 r0 -1', 'hlt'])['divergence']['field'] == 'decode'  # '-' in the immediate field
@@ -0,0 +1,48 @@
+import pytest
+
+import app
+from assembly_to_schematic import assembler
+from batch_simulator import BatchSimulator, differential_check
+
+EXAMPLES = ['collatz_conjecture', 'fibonacci', 'hello_world', 'line_drawing', 'pong']
+
+# Preprocessed snippets (labels already resolved) for every pass: report key, lines, optimized lines
+PASSES = [
+    ('removed_nops', ['ADI R1 R0 1', 'NOP', 'PT-ST R1 P2', 'HLT'], ['ADI R1 R0 1', 'PT-ST R1 P2', 'HLT']),
+    ('removed_dead_code', ['ADI R1 R0 1', 'JMP 3', 'ADI R1 R0 2', 'PT-ST R1 P2', 'HLT'], ['ADI R1 R0 1', 'PT-ST R1 P2', 'HLT']),
+    ('folded_adi', ['ADI R1 R0 1', 'ADI R1 R1 2', 'PT-ST R1 P2', 'HLT'], ['ADI R1 R0 3', 'PT-ST R1 P2', 'HLT']),
+    ('threaded_jumps', ['ADI R1 R1 1', 'BNE 3', 'HLT', 'JMP 5', 'HLT', 'ADI R2 R0 7', 'PT-ST R2 P2', 'HLT'],
+     ['ADI R1 R1 1', 'BNE 3', 'HLT', 'ADI R2 R0 7', 'PT-ST R2 P2', 'HLT']),
+    ('removed_r0_writes', ['ADD R0 R1 R2', 'ADI R1 R0 1', 'LD R0 R0 5', 'PT-LD R0 P0', 'PT-ST R1 P2', 'HLT'],
+     ['ADI R1 R0 1', 'PT-LD R0 P0', 'PT-ST R1 P2', 'HLT']),
+    ('removed_jumps_to_next', ['ADI R1 R0 3', 'JMP 2', 'PT-ST R1 P2', 'HLT'], ['ADI R1 R0 3', 'PT-ST R1 P2', 'HLT'])
+]
+
+
+@pytest.mark.parametrize('name', EXAMPLES)
+def test_optimized_examples_behave_the_same(name):
+    lines = app.Simulator(1).preprocess_source(app.library.read('example_programs', f'{name}.txt'))
+    optimized_lines, _ = assembler.optimize_assembly(lines)
+    check = differential_check(lines, optimized_lines, lanes=16, max_cycles=200000)
+
+    assert check['result'] == 'passed'
+    assert check['compared_lanes'] == 16
+
+
+@pytest.mark.parametrize('key, lines, expected', PASSES)
+def test_pass(key, lines, expected):
+    optimized_lines, report = assembler.optimize_assembly(lines)
+
+    assert optimized_lines == expected
+    assert report[key] > 0
+    assert differential_check(lines, optimized_lines, lanes=4, max_cycles=100)['result'] == 'passed'
+
+
+@pytest.mark.parametrize('lines', [['ADI R1 R0 200', 'LD R0 R1 100', 'HLT'], ['LD R0 R0 -1', 'HLT'], ['LD R0 R0 256', 'HLT']])
+def test_faulting_loads_into_r0_are_kept(lines):
+    optimized_lines, _ = assembler.optimize_assembly(lines)
+    batch = BatchSimulator(optimized_lines, 1)
+    batch.run(100)
+
+    assert optimized_lines == lines
+    assert batch.lane_state(0)['error'] == 'Data memory address out of range'
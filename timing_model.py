@@ -0,0 +1,129 @@
+from assembly_to_schematic import assembler
+
+# Estimates how long a program takes on the real FROSTBYTE CPU in Minecraft.
+#
+# Every instruction costs a number of redstone ticks, depending on its opcode and (for port instructions) on the I/O device.
+# Taken branches / jumps and CAL / RET cost extra.
+# The defaults are rough values (~20 seconds per instruction at vanilla speed), measure the CPU and adjust them if needed.
+
+REDSTONE_TICKS_PER_SECOND: float = 10.0  # Vanilla: 20 game ticks / second, 1 redstone tick = 2 game ticks
+
+OPCODE_TICKS: dict[str, int] = {'NOP': 180,
+                                'ADD': 190,  # ALU Instructions
+                                'SUB': 190,
+                                'XOR': 190,
+                                'OR': 190,
+                                'AND': 190,
+                                'RSH': 190,
+                                'ADI': 190,
+                                'ST': 210,  # Data Memory Instructions
+                                'LD': 210,
+                                'PT-ST': 200,  # Port Instructions (+ PORT_STORE_TICKS / PORT_LOAD_TICKS)
+                                'PT-LD': 200,
+                                'JMP': 180,  # Jump Instructions (+ TAKEN_BRANCH_PENALTY if taken)
+                                'CAL': 180,  # (+ CALL_PENALTY)
+                                'RET': 180,  # (+ RETURN_PENALTY)
+                                'BEQ': 180,
+                                'BNE': 180,
+                                'BLT': 180,
+                                'BGT': 180,
+                                'HLT': 180
+                                }
+
+PORT_STORE_TICKS: dict[int, int] = {0: 10,  # Letter Buffer Control
+                                    1: 10,  # Letter
+                                    2: 10,  # Number Display
+                                    3: 0,  # Screen X, Y
+                                    4: 20,  # Draw Pixel
+                                    5: 0,  # Screen Data
+                                    6: 60,  # Set all Pixels
+                                    7: 80  # Push Screen Buffer
+                                    }
+
+PORT_LOAD_TICKS: dict[int, int] = {0: 10,  # Controller
+                                   1: 0  # Random Number
+                                   }
+
+TAKEN_BRANCH_PENALTY: int = 20
+CALL_PENALTY: int = 30
+RETURN_PENALTY: int = 30
+
+BRANCH_INSTRUCTIONS: list[str] = ['JMP', 'BEQ', 'BNE', 'BLT', 'BGT']
+
+
+class TimingModel:
+    def __init__(self, opcode_ticks: dict[str, int] | None = None, port_store_ticks: dict[int, int] | None = None,
+                 port_load_ticks: dict[int, int] | None = None, taken_branch_penalty: int = TAKEN_BRANCH_PENALTY,
+                 call_penalty: int = CALL_PENALTY, return_penalty: int = RETURN_PENALTY,
+                 redstone_ticks_per_second: float = REDSTONE_TICKS_PER_SECOND):
+        self.opcode_ticks: dict[str, int] = {**OPCODE_TICKS, **(opcode_ticks or {})}
+        self.port_store_ticks: dict[int, int] = {**PORT_STORE_TICKS, **(port_store_ticks or {})}
+        self.port_load_ticks: dict[int, int] = {**PORT_LOAD_TICKS, **(port_load_ticks or {})}
+        self.taken_branch_penalty: int = taken_branch_penalty
+        self.call_penalty: int = call_penalty
+        self.return_penalty: int = return_penalty
+        self.redstone_ticks_per_second: float = redstone_ticks_per_second  # e.g. /tick rate or MCHPRS /rtps
+
+    def instruction_ticks(self, parts: list[str], jumped: bool) -> int:
+        operation = parts[0]
+        ticks = self.opcode_ticks[operation]
+
+        if operation == 'PT-ST':
+            ticks += self.port_store_ticks.get(int(parts[2][1:]) & 0b111, 0)
+        elif operation == 'PT-LD':
+            ticks += self.port_load_ticks.get(int(parts[2][1:]) & 0b111, 0)
+        elif operation == 'CAL':
+            ticks += self.call_penalty
+        elif operation == 'RET':
+            ticks += self.return_penalty
+        elif operation in BRANCH_INSTRUCTIONS and jumped:
+            ticks += self.taken_branch_penalty
+
+        return ticks
+
+    def seconds(self, ticks: int) -> float:
+        return ticks / self.redstone_ticks_per_second
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}'
+
+
+def find_regions(instructions: list[list[str]]) -> list[tuple[int, int]]:
+    # Splits the program into basic blocks [start, end), a block only gets entered at its start
+    leaders = {0} | assembler.branch_entries(instructions)
+    for address, parts in enumerate(instructions):
+        if parts[0] in assembler.JUMP_INSTRUCTIONS or parts[0] in ['RET', 'HLT']:
+            leaders.add(address + 1)
+
+    starts = sorted(leader for leader in leaders if leader < len(instructions))
+    return list(zip(starts, starts[1:] + [len(instructions)]))
+
+
+def estimate_program(lines: list[str], model: TimingModel, profile: dict[int, int] | None = None,
+                     regions: int = 5) -> dict:
+    # Without a profile: Static estimate, every instruction executed once (jumps, calls and returns taken, branches not taken)
+    # With a profile (ticks per address, collected by the simulator): Where the simulated program actually spent its time
+    instructions = [line.upper().split() for line in lines]
+
+    if profile is None:
+        profile = {address: model.instruction_ticks(parts, jumped=parts[0] in ['JMP', 'CAL', 'RET'])
+                   for address, parts in enumerate(instructions)}
+
+    region_ticks = []
+    for start, end in find_regions(instructions):
+        ticks = sum(profile.get(address, 0) for address in range(start, end))
+        if ticks:
+            region_ticks.append({'start': start, 'end': end - 1, 'ticks': ticks,
+                                 'time': format_duration(model.seconds(ticks)), 'first_instruction': lines[start]})
+
+    total_ticks = sum(profile.values())
+
+    return {
+        'instructions': len(instructions),
+        'ticks': total_ticks,
+        'time': format_duration(model.seconds(total_ticks)),
+        'regions': sorted(region_ticks, key=lambda region: region['ticks'], reverse=True)[:regions]
+    }
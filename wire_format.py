@@ -0,0 +1,41 @@
+import struct
+
+# Binary format of the 'simulation_update' Socket.IO event (sent as binary attachment, decoded in static/script.js)
+#
+# All numbers are little endian. The 16 Bit part comes first, so the client can read it with a Uint16Array:
+#   u16 format version
+#   u16 section mask (bit n set: SECTIONS[n] is included)
+#   u16 program counter
+#   u16 status (bit 0: simulation running)
+#   u16[32] registers                                   (if 'registers' is subscribed)
+#   u16[8] read-only ports                              (if 'ps' is subscribed)
+#   u16[8] write-only ports                             (if 'pd' is subscribed)
+#   u16 first address, u16 count, u16[count] memory     (if 'data_memory' is subscribed)
+#   u16 depth, u16[depth] return addresses              (if 'call_stack' is subscribed)
+#   u16 ALU flags (bit 0: BEQ, bit 1: BNE, bit 2: BLT, bit 3: BGT) (if 'alu_flags' is subscribed)
+# Followed by bytes:
+#   u8[121] screen, 31 x 31 pixels row by row, 1 bit each (LSB first)
+#   letters, number, big number, in-game time: u8 length + ASCII each
+
+FORMAT_VERSION: int = 1
+SECTIONS: list[str] = ['registers', 'ps', 'pd', 'data_memory', 'call_stack', 'alu_flags']
+ALU_FLAG_BITS: list[str] = ['BEQ', 'BNE', 'BLT', 'BGT']
+SCREEN_BYTES: int = (31 * 31 + 7) // 8
+
+
+def pack_screen(rows: list[int]) -> bytes:
+    # rows: One integer per row, bit n is the pixel in column n (see io_devices.Screen)
+    return sum(row << (31 * index) for index, row in enumerate(rows)).to_bytes(SCREEN_BYTES, 'little')
+
+
+def pack_string(text: str) -> bytes:
+    encoded = text.encode('ascii', errors='replace')[:255]
+    return bytes([len(encoded)]) + encoded
+
+
+def encode_update(words: list[int], sections: list[str], screen: bytes, strings: list[str]) -> bytes:
+    # words: Program counter, status and the u16 values of the included sections (in SECTIONS order)
+    mask = sum(1 << index for index, section in enumerate(SECTIONS) if section in sections)
+    return (struct.pack(f'<{len(words) + 2}H', FORMAT_VERSION, mask, *words) + screen +
+            b''.join(pack_string(text) for text in strings))
+